@@ -1,17 +1,34 @@
 from fastapi import FastAPI, HTTPException
-import requests
+from contextlib import asynccontextmanager
 import json
+import os
+import sys
 import numpy as np
 from typing import List, Dict, Any
 import uvicorn
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
-app = FastAPI(title="合同模板相似度查询API", description="查询与输入文本最相似的合同模板")
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import config
+from common.vector_index import top_k_indices
+from common.embedding_client import EmbeddingClient, EmbeddingServiceError
+from common.embedding_cache import EmbeddingCache
+
+embedding_client = EmbeddingClient(cache=EmbeddingCache())
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await embedding_client.start()
+    yield
+    await embedding_client.close()
+
+app = FastAPI(title="合同模板相似度查询API", description="查询与输入文本最相似的合同模板", lifespan=lifespan)
 
 vector_data = None
 
 class TextRequest(BaseModel):
     text: str
+    top_k: int = Field(config.DEFAULT_TOP_K, ge=1)
 
 class TemplateResponse(BaseModel):
     templates: List[str]
@@ -31,21 +48,11 @@ def load_vector_data(file_path: str = "/home/user/opt/ssy/contract_template/vect
     
     return vector_data
 
-def get_vector(text: str, api_url: str = "http://192.168.10.58:8101/text2vector/") -> List[float]:
-    headers = {"Content-Type": "application/json"}
-    data = {"text": text}
-    
+async def get_vector(text: str) -> List[float]:
     try:
-        response = requests.post(api_url, headers=headers, json=data)
-        if response.status_code == 200:
-            response_data = response.json()
-            if isinstance(response_data, dict) and "result" in response_data:
-                return response_data["result"]
-            return response_data
-        else:
-            raise HTTPException(status_code=response.status_code, detail=f"向量服务请求失败: {response.text}")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"向量服务请求异常: {str(e)}")
+        return await embedding_client.get_vector(text)
+    except EmbeddingServiceError as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
     vec1 = np.array(vec1)
@@ -69,12 +76,13 @@ async def find_similar_templates(request: TextRequest):
         request: 包含输入文本的请求
         
     Returns:
-        最相似的三个模板及其相似度
+        最相似的 top_k 个模板及其相似度
     """
     data = load_vector_data()
     
-    input_vector = get_vector(request.text)
+    input_vector = await get_vector(request.text)
     
+    templates = []
     similarities = []
     for item in data:
         template = item.get("template", "")
@@ -83,17 +91,15 @@ async def find_similar_templates(request: TextRequest):
         if not vector:
             continue
         
-        similarity = cosine_similarity(input_vector, vector)
-        similarities.append((template, similarity))
+        templates.append(template)
+        similarities.append(cosine_similarity(input_vector, vector))
 
-    similarities.sort(key=lambda x: x[1], reverse=True)
-    
-    # 获取前三个最相似的模板
-    top_templates = similarities[:3]
+    # 部分选择取前k个最相似的模板
+    top_rows = top_k_indices(np.asarray(similarities, dtype=np.float64), min(request.top_k, config.MAX_TOP_K))
     
     return {
-        "templates": [item[0] for item in top_templates],
-        "similarities": [item[1] for item in top_templates]
+        "templates": [templates[i] for i in top_rows],
+        "similarities": [float(similarities[i]) for i in top_rows]
     }
 
 @app.get("/health")
@@ -1,15 +1,42 @@
-from fastapi import FastAPI, HTTPException
-import requests
+from fastapi import Depends, FastAPI, Header, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+from contextlib import asynccontextmanager, nullcontext
+import hmac
 import json
+import os
 import re
+import sys
+import threading
+import time
 import numpy as np
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Literal, Optional, Tuple
 import uvicorn
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
-app = FastAPI(title="合同模板相似度查询API", description="查询与输入文本最相似的合同模板")
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import config
+from common.vector_index import VectorIndex, FIELDS, top_k_indices
+from common.hot_reload import HotReloader, file_signature
+from common.vector_store import content_hash, is_columnar_store, load_columnar, load_ann
+from common.segment_log import append_segment, compact, delete_ops, list_segments, read_ops, reduce_ops, upsert_ops
+from common.embedding_client import EmbeddingClient, EmbeddingServiceError
+from common.embedding_cache import EmbeddingCache
+from common.lexical_index import BM25Index
+from common.metrics import REGISTRY, StageTimer
+from common.shared_index import SharedIndexStore
 
-vector_data = None
+VECTOR_FILE_PATH = config.VECTOR_FILE_PATH
+# 列式二进制存储目录（由 script/convert_vector_store.py 生成），存在时优先使用
+VECTOR_STORE_PATH = config.VECTOR_STORE_PATH
+# 检查向量文件是否变化的间隔（秒）
+RELOAD_CHECK_INTERVAL = 5.0
+# 批量查询单次最多请求数
+MAX_BATCH_SIZE = 200
+# 全量打分时每次矩阵乘法的查询条数，限制 (条数, 模板数) 相似度矩阵的内存
+RANK_CHUNK_SIZE = 16
+# 使用近似索引时，词法分数最高的这些行也加入候选
+LEXICAL_CANDIDATES = 100
 
 class TextRequest(BaseModel):
     template1: Optional[str] = None
@@ -18,110 +45,173 @@ class TextRequest(BaseModel):
     text2: str  
     text3: str 
     text4: str  
+    top_k: int = Field(config.DEFAULT_TOP_K, ge=1)
+    # 混合检索中BM25分数的权重，为空时使用 config.LEXICAL_WEIGHT，为0时只用向量分数
+    lexical_weight: Optional[float] = Field(None, ge=0)
+    # 关键词候选过滤方式，为空时使用 config.KEYWORD_FILTER
+    keyword_filter: Optional[Literal["off", "union", "intersect"]] = None
+
+class TemplateRecord(BaseModel):
+    template1: str = ""
+    template2: str = ""
+    text1: str
+    text2: str
+    text3: str
+    text4: str
+    fulltext: Optional[str] = None
+    # 各部分的关键词，如 {"text1": ["玉米", "储存"]}，用于关键词候选过滤
+    keywords: Optional[Dict[str, List[str]]] = None
+    # 已有向量时直接使用，否则按 text1..text4 请求向量服务
+    vectors: Optional[Dict[str, List[float]]] = None
+
+class TemplateUpsert(TemplateRecord):
+    template: str
 
 class TemplateResponse(BaseModel):
     templates: List[str]
     scores: List[float]
     category_scores: List[Dict[str, float]]
     similarities: Dict[str, List[float]]
+    lexical_scores: Optional[List[float]] = None
+    # 使用关键词过滤时，每个结果与请求命中的关键词
+    matched_keywords: Optional[List[Dict[str, List[str]]]] = None
+
+def load_vector_data(vector_file_path: str = VECTOR_FILE_PATH) -> List[Dict[str, Any]]:
+    """
+    读取JSON格式的向量数据
 
-def load_vector_data():
-    global vector_data
-    vector_file_path = "/home/user/opt/ssy/contract_template/data/vector_data/vector_new.json"
+    由热加载在后台调用，文件正在写入或被截断时解析失败直接抛出异常，
+    HotReloader 保留旧快照继续服务、下次检查时再重试；服务进程不修改数据文件。
+    """
     try:
         with open(vector_file_path, 'r', encoding='utf-8') as f:
-            content = ""
-            for line in f:
-                if not line.strip().startswith(('#', '//')):
-                    content += line
-
-            if content.strip():
-                vector_data = json.loads(content)
-                print(f"成功加载向量数据，共 {len(vector_data)} 条记录")
-            else:
-                print("警告：向量数据文件为空")
-                vector_data = []
+            lines = [line for line in f if not line.strip().startswith(('#', '//'))]
     except FileNotFoundError:
         print(f"警告：向量数据文件 {vector_file_path} 不存在")
-        vector_data = []
+        return []
+
+    content = "".join(lines)
+    if not content.strip():
+        print("警告：向量数据文件为空")
+        return []
+    try:
+        vector_data = json.loads(content)
     except json.JSONDecodeError as e:
+        start_line = max(0, e.lineno - 10)
+        end_line = min(len(lines), e.lineno + 10)
         print(f"JSON解析错误: {e}")
-        try:
-            with open(vector_file_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-
-            error_line = e.lineno
-            start_line = max(0, error_line - 10)
-            end_line = min(len(lines), error_line + 10)
-            
-            print(f"错误位置附近的内容 (行 {start_line} 到 {end_line}):")
-            for i in range(start_line, end_line):
-                if i == error_line - 1:
-                    print(f">>> {i+1}: {lines[i].strip()}")
-                else:
-                    print(f"    {i+1}: {lines[i].strip()}")
-
-            fixed_content = "[\n"
-            in_object = False
-            valid_objects = []
-            current_object = ""
-            
-            for line in lines:
-                line = line.strip()
-                if line.startswith("{"):
-                    in_object = True
-                    current_object = line + "\n"
-                elif line.endswith("}") or line.endswith("},"):
-                    if in_object:
-                        current_object += line + "\n"
-                        try:
-                            test_obj = json.loads(current_object.rstrip(",\n") + "}")
-                            valid_objects.append(current_object)
-                        except:
-                            print(f"跳过无效对象: {current_object[:50]}...")
-                        in_object = False
-                        current_object = ""
-                elif in_object:
-                    current_object += line + "\n"
-
-            fixed_json = "[\n" + "".join(valid_objects).rstrip(",\n") + "\n]"
-
-            vector_data = json.loads(fixed_json)
-            print(f"成功修复并加载向量数据，共 {len(vector_data)} 条记录")
-
-            backup_path = vector_file_path + ".backup"
-            print(f"备份原文件到 {backup_path}")
-            import shutil
-            shutil.copy2(vector_file_path, backup_path)
-            
-            with open(vector_file_path, 'w', encoding='utf-8') as f:
-                f.write(fixed_json)
-            print(f"已将修复后的数据保存到 {vector_file_path}")
-            
-        except Exception as repair_error:
-            print(f"尝试修复JSON失败: {repair_error}")
-            vector_data = []
-            raise HTTPException(status_code=500, detail=f"加载向量数据失败: {e}")
-    except Exception as e:
-        print(f"加载向量数据时发生错误: {e}")
-        vector_data = []
-        raise HTTPException(status_code=500, detail=f"加载向量数据失败: {e}")
+        print(f"错误位置附近的内容 (行 {start_line} 到 {end_line}):")
+        for i in range(start_line, end_line):
+            marker = ">>>" if i == e.lineno - 1 else "   "
+            print(f"{marker} {i+1}: {lines[i].strip()}")
+        raise ValueError(f"向量数据文件 {vector_file_path} 不是有效的JSON: {e}") from e
+    print(f"成功加载向量数据，共 {len(vector_data)} 条记录")
+    return vector_data
 
-def get_vector(text: str, api_url: str = "http://192.168.10.58:8101/text2vector/") -> List[float]:
-    headers = {"Content-Type": "application/json"}
-    data = {"text": text}
-    
+def build_vector_index(vector_path: str) -> VectorIndex:
+    if is_columnar_store(vector_path):
+        meta, matrices = load_columnar(vector_path)
+        vector_index = VectorIndex.from_columnar(meta, matrices, ann=load_ann(vector_path))
+        print(f"成功加载列式向量数据，共 {len(vector_index)} 条记录")
+    else:
+        vector_index = VectorIndex.from_records(load_vector_data(vector_path))
+    vector_index = vector_index.quantize(config.VECTOR_DTYPE)
+
+    # 重放尚未合并的追加段（管理接口和维护脚本写入的修改）
+    segments = list_segments(VECTOR_FILE_PATH)
+    if segments:
+        reset, changes = reduce_ops(op for segment in segments for op in read_ops(segment))
+        vector_index = vector_index.apply_changes(changes, reset=reset)
+        print(f"已应用 {len(segments)} 个未合并的段，当前共 {vector_index.live_count} 条记录")
+    return vector_index
+
+def store_signature(vector_path: str):
+    """数据文件和追加段列表，任一变化都需要重新加载"""
+    return (file_signature(vector_path), tuple(list_segments(VECTOR_FILE_PATH)))
+
+# 多个工作进程共享的索引快照目录，为空时每个进程各自构建索引
+shared_index = SharedIndexStore(config.SHARED_INDEX_DIR) if config.SHARED_INDEX_DIR else None
+# 最近一次映射或发布的共享快照 (代数, 索引)
+shared_snapshot: Tuple[Optional[int], Optional[VectorIndex]] = (None, None)
+
+def served_shared_generation() -> Optional[int]:
+    """正在服务的索引对应的共享快照代数；正在服务的不是映射得到的索引（如加载结果被丢弃）时为None"""
+    generation, vector_index = shared_snapshot
+    return generation if vector_index is not None and vector_index is vector_store.current else None
+
+def load_serving_index(vector_path: str) -> VectorIndex:
+    """
+    加载服务使用的索引
+
+    配置了共享目录时，由第一个发现数据变化的进程构建并发布快照，
+    其余进程直接以只读内存映射打开同一份快照。
+    """
+    global shared_snapshot
+    if shared_index is None:
+        return build_vector_index(vector_path)
+    # 签名在锁内读取，等锁期间其他进程发布的新一代可以直接映射
+    shared_snapshot = shared_index.load(lambda: store_signature(vector_path), lambda: build_vector_index(vector_path))
+    generation, vector_index = shared_snapshot
+    print(f"已映射共享索引快照第 {generation} 代，共 {vector_index.live_count} 条记录")
+    return vector_index
+
+vector_store = HotReloader(
+    VECTOR_STORE_PATH if is_columnar_store(VECTOR_STORE_PATH) else VECTOR_FILE_PATH,
+    load_serving_index,
+    check_interval=RELOAD_CHECK_INTERVAL,
+    signature=store_signature
+)
+
+def load_lexical_index(lexical_path: str) -> Optional[BM25Index]:
+    if not os.path.exists(lexical_path):
+        return None
+    lexical_index = BM25Index.load(lexical_path)
+    print(f"成功加载BM25索引，共 {len(lexical_index)} 个模板")
+    return lexical_index
+
+lexical_store = HotReloader(config.LEXICAL_INDEX_PATH, load_lexical_index, check_interval=RELOAD_CHECK_INTERVAL)
+
+# 管理接口的写操作和合并依次进行，查询不加锁，始终读取某一份完整的快照
+admin_lock = threading.Lock()
+compacting = threading.Event()
+
+embedding_client = EmbeddingClient(cache=EmbeddingCache())
+
+REQUEST_SECONDS = REGISTRY.histogram("template_request_seconds", "查询接口总耗时（秒）", ["endpoint"])
+STAGE_SECONDS = REGISTRY.histogram("template_stage_seconds", "查询各阶段耗时（秒），批量查询为各条查询之和", ["endpoint", "stage"])
+REGISTRY.gauge("template_store_templates", "索引中有效的模板数",
+               fn=lambda: vector_store.current.live_count if vector_store.current is not None else 0)
+REGISTRY.gauge("template_store_rows", "索引行数，包括尚未合并的已删除行",
+               fn=lambda: len(vector_store.current) if vector_store.current is not None else 0)
+REGISTRY.gauge("template_index_generation", "索引快照的代数，每次加载或增量更新加一", ["index"],
+               fn=lambda: {("vector",): vector_store.generation, ("lexical",): lexical_store.generation})
+REGISTRY.gauge("template_index_load_seconds", "最近一次加载和构建索引的耗时（秒）", ["index"],
+               fn=lambda: {(name,): store.load_seconds for name, store in (("vector", vector_store), ("lexical", lexical_store))
+                           if store.load_seconds is not None})
+REGISTRY.gauge("template_shared_generation", "当前映射的共享索引快照代数（未启用共享时为0）",
+               fn=lambda: served_shared_generation() or 0)
+REGISTRY.counter("template_index_reload_failures_total", "后台重新加载失败次数", ["index"],
+                 fn=lambda: {("vector",): vector_store.failures, ("lexical",): lexical_store.failures})
+REGISTRY.counter("embedding_cache_hits_total", "向量缓存命中次数", fn=lambda: embedding_client.cache.hits)
+REGISTRY.counter("embedding_cache_misses_total", "向量缓存未命中次数", fn=lambda: embedding_client.cache.misses)
+REGISTRY.gauge("embedding_cache_hit_ratio", "向量缓存命中率", fn=lambda: embedding_client.cache.stats()["hit_rate"])
+REGISTRY.gauge("embedding_cache_size", "向量缓存内存中的条数", fn=lambda: embedding_client.cache.stats()["size"])
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    vector_store.load()
+    lexical_store.load()
+    await embedding_client.start()
+    yield
+    await embedding_client.close()
+
+app = FastAPI(title="合同模板相似度查询API", description="查询与输入文本最相似的合同模板", lifespan=lifespan)
+
+async def get_vectors(texts: List[str]) -> List[List[float]]:
     try:
-        response = requests.post(api_url, headers=headers, json=data)
-        if response.status_code == 200:
-            response_data = response.json()
-            if isinstance(response_data, dict) and "result" in response_data:
-                return response_data["result"]
-            return response_data
-        else:
-            raise HTTPException(status_code=response.status_code, detail=f"向量服务请求失败: {response.text}")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"向量服务请求异常: {str(e)}")
+        return await embedding_client.get_vectors(texts)
+    except EmbeddingServiceError as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 def clean_text(text: str) -> str:
     text = text.strip()
@@ -140,92 +230,379 @@ def clean_text(text: str) -> str:
 def extract_chinese(text):
     return ''.join(re.findall(r'[\u4e00-\u9fff]+', text))
 
-def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
-    vec1 = np.array(vec1)
-    vec2 = np.array(vec2)
-    
-    dot_product = np.dot(vec1, vec2)
-    norm_vec1 = np.linalg.norm(vec1)
-    norm_vec2 = np.linalg.norm(vec2)
-    
-    if norm_vec1 == 0 or norm_vec2 == 0:
-        return 0
-    
-    return dot_product / (norm_vec1 * norm_vec2)
+def category_bonus(vector_index: VectorIndex, field: str, request_value: Optional[str]) -> np.ndarray:
+    """分类与请求一致的模板加4分，通过分类倒排索引直接定位行"""
+    scores = np.zeros(len(vector_index))
+    request_value = extract_chinese(request_value or "")
+    if request_value:
+        scores[vector_index.categories[field].rows(request_value)] = 4
+    return scores
+
+def request_fields(request: TextRequest) -> Dict[str, str]:
+    """请求文本与向量数据中字段的对应关系"""
+    return {"text1": request.text2, "text2": request.text1, "text3": request.text3, "text4": request.text4}
+
+async def embed_requests(text_requests: List[TextRequest]) -> Dict[str, np.ndarray]:
+    """一次获取全部请求四个字段的向量（批量接口或并发单条请求），按字段堆叠成 (m, dim) 矩阵"""
+    texts = []
+    for request in text_requests:
+        texts.extend(request_fields(request)[field] for field in FIELDS)
+    vectors = await get_vectors(texts)
+    return {field: np.asarray(vectors[i::len(FIELDS)], dtype=np.float32) for i, field in enumerate(FIELDS)}
+
+# (BM25索引, 向量索引, 文档对应的行号)，两个索引都没有变化时复用
+_lexical_rows = (None, None, None)
+
+def lexical_row_scores(lexical_index: BM25Index, vector_index: VectorIndex, request: TextRequest) -> np.ndarray:
+    """请求四个字段文本的BM25分数，按最大值归一化到[0,1]并按向量索引的行排列"""
+    global _lexical_rows
+    if _lexical_rows[0] is not lexical_index or _lexical_rows[1] is not vector_index:
+        _lexical_rows = (lexical_index, vector_index, lexical_index.doc_rows(vector_index.positions))
+    doc_rows = _lexical_rows[2]
+
+    scores = lexical_index.scores("\n".join([request.text1, request.text2, request.text3, request.text4]))
+    result = np.zeros(len(vector_index))
+    top = scores.max() if len(scores) else 0.0
+    if top > 0:
+        found = doc_rows >= 0
+        result[doc_rows[found]] = scores[found] / top
+    return result
+
+def keyword_candidates(vector_index: VectorIndex, request: TextRequest,
+                       mode: str) -> Tuple[Optional[np.ndarray], Dict[str, List[str]]]:
+    """
+    关键词倒排表生成候选行
+
+    在请求每个字段的文本中查找该字段词表中的关键词，字段内取命中关键词倒排表的并集，
+    字段之间按 mode 取交集或并集。候选太少时 intersect 放宽为 union，仍然太少时
+    返回 None（不过滤）。同时返回每个字段命中的关键词。
+    """
+    matched = {}
+    field_rows = []
+    for field, text in request_fields(request).items():
+        keywords = vector_index.keyword_index[field].match(text)
+        if keywords:
+            matched[field] = keywords
+            field_rows.append(np.unique(np.concatenate([vector_index.keyword_index[field].rows(keyword) for keyword in keywords])))
+    if not field_rows:
+        return None, matched
+
+    min_candidates = max(request.top_k, config.KEYWORD_MIN_CANDIDATES)
+    if mode == "intersect":
+        rows = field_rows[0]
+        for other in field_rows[1:]:
+            rows = np.intersect1d(rows, other, assume_unique=True)
+        if len(rows) >= min_candidates:
+            return rows, matched
+    rows = field_rows[0]
+    for other in field_rows[1:]:
+        rows = np.union1d(rows, other)
+    return (rows if len(rows) >= min_candidates else None), matched
+
+def rank_templates(vector_index: VectorIndex, text_requests: List[TextRequest],
+                   input_vectors: Dict[str, np.ndarray],
+                   lexical_index: Optional[BM25Index] = None,
+                   timer: Optional[StageTimer] = None) -> List[Dict[str, Any]]:
+    """
+    对每条查询打分排序，返回与 text_requests 一一对应的结果
+
+    纯计算，不涉及IO，接口在线程池中调用（numpy 计算时释放GIL），不阻塞事件循环。
+    """
+    timer = timer or StageTimer()
+    use_ann = vector_index.ann is not None and config.ANN_NPROBE > 0
+    all_similarities = None
+    chunk_start = None
+
+    results = []
+    for q, request in enumerate(text_requests):
+        lexical_weight = request.lexical_weight if request.lexical_weight is not None else config.LEXICAL_WEIGHT
+        lexical_scores = None
+        if lexical_weight > 0 and lexical_index is not None:
+            with timer.stage("lexical"):
+                lexical_scores = lexical_row_scores(lexical_index, vector_index, request) * lexical_weight
+
+        keyword_mode = request.keyword_filter or config.KEYWORD_FILTER
+        keyword_rows, matched = None, None
+        if keyword_mode != "off" and vector_index.has_keywords:
+            with timer.stage("keyword"):
+                keyword_rows, matched = keyword_candidates(vector_index, request, keyword_mode)
+
+        scoring_start = time.perf_counter()
+        if keyword_rows is not None:
+            # 关键词命中的模板作为候选，只对候选做精确的加权打分
+            rows = keyword_rows
+            if lexical_scores is not None:
+                rows = np.union1d(rows, top_k_indices(lexical_scores, LEXICAL_CANDIDATES))
+            query_vectors = {field: input_vectors[field][q] for field in FIELDS}
+            similarities = vector_index.similarities(query_vectors, rows)
+            vector_scores = vector_index.weighted_score(similarities)
+        elif use_ann:
+            # 近似索引取候选行，再对候选做精确的加权打分
+            query_vectors = {field: input_vectors[field][q] for field in FIELDS}
+            with timer.stage("ann"):
+                rows = vector_index.candidate_rows(query_vectors, config.ANN_NPROBE)
+            scoring_start = time.perf_counter()
+            if lexical_scores is not None:
+                # 词法命中但向量不在探测簇中的模板也参与排序
+                rows = np.union1d(rows, top_k_indices(lexical_scores, LEXICAL_CANDIDATES))
+            similarities = vector_index.similarities(query_vectors, rows)
+            vector_scores = vector_index.weighted_score(similarities)
+        else:
+            if chunk_start is None or q >= chunk_start + RANK_CHUNK_SIZE:
+                # 每 RANK_CHUNK_SIZE 条查询每个字段一次矩阵-矩阵乘法，得到 (条数, n) 的相似度
+                chunk_start = q
+                all_similarities = vector_index.similarities(
+                    {field: input_vectors[field][q:q + RANK_CHUNK_SIZE] for field in FIELDS})
+                all_scores = vector_index.weighted_score(all_similarities)
+            rows = np.arange(len(vector_index))
+            similarities = {field: all_similarities[field][q - chunk_start] for field in FIELDS}
+            vector_scores = all_scores[q - chunk_start]
+
+        template1_scores = category_bonus(vector_index, "template1", request.template1)[rows]
+        template2_scores = category_bonus(vector_index, "template2", request.template2)[rows]
+        query_scores = vector_scores + template1_scores + template2_scores
+        if lexical_scores is not None:
+            lexical_scores = lexical_scores[rows]
+            query_scores = query_scores + lexical_scores
+        if vector_index.deleted is not None:
+            query_scores[vector_index.deleted[rows]] = -np.inf
+        timer.add("scoring", time.perf_counter() - scoring_start)
+
+        # 部分选择取前k个，分数相同时保持原有顺序
+        ranking_start = time.perf_counter()
+        top = top_k_indices(query_scores, min(request.top_k, config.MAX_TOP_K))
+        top = top[np.isfinite(query_scores[top])]
+
+        results.append({
+            "templates": [vector_index.templates[rows[i]] for i in top],
+            "scores": [float(query_scores[i]) for i in top],
+            "category_scores": [
+                {"template1": float(template1_scores[i]), "template2": float(template2_scores[i])}
+                for i in top
+            ],
+            "similarities": {
+                field: [float(similarities[field][i]) * 100 for i in top]
+                for field in FIELDS
+            },
+            "lexical_scores": [float(lexical_scores[i]) for i in top] if lexical_scores is not None else None,
+            "matched_keywords": [
+                {
+                    field: [keyword for keyword in keywords if keyword in vector_index.keywords[rows[i]].get(field, ())]
+                    for field, keywords in matched.items()
+                }
+                for i in top
+            ] if matched is not None else None
+        })
+        timer.add("ranking", time.perf_counter() - ranking_start)
+    return results
+
+def finish_timing(timer: StageTimer, endpoint: str, response: Response):
+    """记录本次请求的总耗时和各阶段耗时，按配置返回 Server-Timing 响应头"""
+    REQUEST_SECONDS.observe(timer.elapsed, endpoint=endpoint)
+    timer.finish(STAGE_SECONDS, endpoint=endpoint)
+    if config.SERVER_TIMING:
+        response.headers["Server-Timing"] = timer.server_timing()
 
 @app.post("/find_similar_templates/", response_model=TemplateResponse)
-async def find_similar_templates(request: TextRequest):
+async def find_similar_templates(request: TextRequest, response: Response):
+    timer = StageTimer()
 
-    load_vector_data()
+    # 取当前快照，文件变化时在后台重新加载，不阻塞本次请求
+    with timer.stage("snapshot"):
+        vector_index = vector_store.get()
+        lexical_index = lexical_store.get()
 
-    global vector_data
-    
-    input_vectors = {
-        "text1": get_vector(request.text2),
-        "text2": get_vector(request.text1),
-        "text3": get_vector(request.text3),
-        "text4": get_vector(request.text4)
-    }
-    
-    scores = []
-    for item in vector_data:
-        template = item.get("template", "")
-        template1 = item.get("template1", "")
-        template2 = item.get("template2", "")
-
-        total_score = 0
-        similarities = {
-            "text1": 0.0,
-            "text2": 0.0,
-            "text3": 0.0,
-            "text4": 0.0
-        }
-        
-        category_score = {
-            "template1": 0.0,
-            "template2": 0.0
-        }
+    # 四个字段的向量并发请求，总耗时约为一次向量服务往返
+    with timer.stage("embedding"):
+        input_vectors = await embed_requests([request])
 
-        request_template1 = extract_chinese(request.template1)
-        request_template2 = extract_chinese(request.template2)
-        
-        if request_template1 and request_template1 == template1:
-            total_score += 4
-            category_score["template1"] = 4
-        
-        if request_template2 and request_template2 == template2:
-            total_score += 4
-            category_score["template2"] = 4
-        
-        vectors = item.get("vectors", {})
-        
-        for text_key in ["text1", "text2", "text3", "text4"]:
-            if text_key in vectors and vectors[text_key]:
-                sim = cosine_similarity(input_vectors[text_key], vectors[text_key])
-                similarities[text_key] = sim * 100
-                
-                if text_key in ["text1", "text2"]:
-                    total_score += sim * 27.6
-                elif text_key in ["text3", "text4"]:
-                    total_score += sim * 18.4
-        
-        scores.append((template, total_score, similarities, category_score))
-    
-    scores.sort(key=lambda x: x[1], reverse=True)
-    
-    top_templates = scores[:3]
-    
-    return {
-        "templates": [item[0] for item in top_templates],
-        "scores": [item[1] for item in top_templates],
-        "category_scores": [item[3] for item in top_templates],
-        "similarities": {
-            "text1": [item[2]["text1"] for item in top_templates],
-            "text2": [item[2]["text2"] for item in top_templates],
-            "text3": [item[2]["text3"] for item in top_templates],
-            "text4": [item[2]["text4"] for item in top_templates]
+    result = (await run_in_threadpool(rank_templates, vector_index, [request], input_vectors, lexical_index, timer))[0]
+    finish_timing(timer, "find", response)
+    return result
+
+@app.post("/find_similar_templates/batch", response_model=List[TemplateResponse])
+async def find_similar_templates_batch(text_requests: List[TextRequest], response: Response):
+    """批量查询，返回结果与请求一一对应"""
+    if len(text_requests) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"单次批量查询最多 {MAX_BATCH_SIZE} 条")
+    if not text_requests:
+        return []
+
+    timer = StageTimer()
+    with timer.stage("snapshot"):
+        vector_index = vector_store.get()
+        lexical_index = lexical_store.get()
+    with timer.stage("embedding"):
+        input_vectors = await embed_requests(text_requests)
+    results = await run_in_threadpool(rank_templates, vector_index, text_requests, input_vectors, lexical_index, timer)
+    finish_timing(timer, "batch", response)
+    return results
+
+@app.get("/categories")
+async def category_counts():
+    """各一级、二级分类下的模板数量"""
+    vector_index = vector_store.get()
+    return {field: index.counts() for field, index in vector_index.categories.items()}
+
+def check_admin_token(x_admin_token: Optional[str] = Header(None)):
+    """管理接口的令牌校验；未配置 ADMIN_TOKEN 时管理接口一律拒绝"""
+    if not config.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="未配置管理令牌，管理接口已禁用")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode("utf-8"), config.ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="管理令牌无效")
+
+def reload_store() -> VectorIndex:
+    """与管理接口的修改和合并互斥地重新加载"""
+    with admin_lock:
+        return vector_store.load()
+
+@app.post("/reload", dependencies=[Depends(check_admin_token)])
+async def reload_vector_data():
+    """立即重新加载向量数据"""
+    vector_index = await run_in_threadpool(reload_store)
+    return {"status": "ok", "count": vector_index.live_count, "generation": vector_store.generation,
+            "shared_generation": served_shared_generation()}
+
+def compact_store():
+    """把追加段合并进数据文件，再从合并后的文件重建索引（去掉墓碑行）"""
+    try:
+        with admin_lock:
+            columnar_path = None
+            if vector_store.path == VECTOR_STORE_PATH:
+                if not os.path.exists(VECTOR_FILE_PATH):
+                    print(f"警告：{VECTOR_FILE_PATH} 不存在，无法合并追加段")
+                    return
+                # 精度和近似索引沿用现有列式存储
+                columnar_path = VECTOR_STORE_PATH
+            # 启用共享快照时与其他进程的修改和合并互斥
+            with shared_index.locked() if shared_index is not None else nullcontext():
+                compact(VECTOR_FILE_PATH, columnar_path=columnar_path)
+            vector_store.load()
+    except Exception as e:
+        print(f"合并追加段失败: {e}")
+    finally:
+        compacting.clear()
+
+def maybe_compact(vector_index: VectorIndex):
+    deleted = len(vector_index) - vector_index.live_count
+    signature = vector_store.loaded_signature
+    segments = len(signature[1]) if signature is not None else 0
+    if deleted <= config.COMPACT_DELETED_RATIO * len(vector_index) and segments < config.COMPACT_MAX_SEGMENTS:
+        return
+    if not compacting.is_set():
+        compacting.set()
+        threading.Thread(target=compact_store, daemon=True).start()
+
+def commit_ops(ops: List[Dict[str, Any]]) -> VectorIndex:
+    """
+    持久化一批修改并增量更新正在服务的索引
+
+    先写入追加段，再在当前快照上应用修改得到新快照并整体替换，
+    正在进行的查询继续使用旧快照。写入的段记入已加载的签名，不会触发重新加载。
+    启用共享快照时在进程间的锁内完成：本进程还没有换上其他进程发布的最新一代时先映射它，
+    新行直接追加到共享的矩阵文件中，修改发布为增量快照，其他进程检查到段变化后直接映射；
+    共享快照与数据文件不一致（如维护脚本写入了段）时重新构建。
+    """
+    global shared_snapshot
+    with admin_lock, (shared_index.locked() if shared_index is not None else nullcontext()):
+        vector_index = vector_store.current
+        signature = vector_store.loaded_signature
+        if shared_index is not None:
+            # 以共享快照为准：当前代与数据文件一致时在当前代上修改，本进程还没换上时先映射，
+            # 在过期的一代上追加会覆盖最新一代已经写在共享文件中的行
+            signature = store_signature(vector_store.path)
+            if not shared_index.matches(signature):
+                signature = None
+            elif served_shared_generation() != shared_index.current_generation():
+                shared_snapshot = shared_index.attach()
+            vector_index = shared_snapshot[1] if signature is not None else vector_index
+        generation = shared_snapshot[0]
+
+        segment = append_segment(VECTOR_FILE_PATH, ops)
+        reset, changes = reduce_ops(ops)
+        if signature is not None:
+            signature = (signature[0], tuple(sorted(signature[1] + (segment,))))
+        previous = None
+        if shared_index is not None and signature != store_signature(vector_store.path):
+            signature = store_signature(vector_store.path)
+            vector_index = build_vector_index(vector_store.path)
+        else:
+            previous = (generation, vector_index)
+            vector_index = vector_index.apply_changes(changes, reset=reset)
+        if shared_index is not None:
+            shared_snapshot = shared_index.share(vector_index, signature, previous=previous)
+            vector_index = shared_snapshot[1]
+        vector_store.replace(vector_index, signature=signature)
+    maybe_compact(vector_index)
+    return vector_index
+
+async def build_records(items: List[Tuple[str, TemplateRecord]]) -> List[Dict[str, Any]]:
+    """把请求转换为与入库脚本相同结构的记录，没有给出向量的一起请求向量服务"""
+    vector_index = vector_store.get()
+    texts = []
+    for _, item in items:
+        if item.vectors is None:
+            texts.extend([item.text1, item.text2, item.text3, item.text4])
+    vectors = iter(await get_vectors(texts) if texts else [])
+
+    records = []
+    for template, item in items:
+        parts = {"text1": item.text1, "text2": item.text2, "text3": item.text3, "text4": item.text4}
+        item_vectors = item.vectors if item.vectors is not None else {field: next(vectors) for field in FIELDS}
+        if set(item_vectors) != set(FIELDS):
+            raise HTTPException(status_code=400, detail=f"模板 {template} 的向量需要包含 {', '.join(FIELDS)}")
+        if item.keywords is not None and not set(item.keywords) <= set(FIELDS):
+            raise HTTPException(status_code=400, detail=f"模板 {template} 的关键词字段只能是 {', '.join(FIELDS)}")
+        if vector_index.dim and any(len(vector) != vector_index.dim for vector in item_vectors.values()):
+            raise HTTPException(status_code=400, detail=f"模板 {template} 的向量维度与索引不一致（{vector_index.dim}）")
+        record = {
+            "template": template,
+            "template1": item.template1,
+            "template2": item.template2,
+            "parts": parts,
+            "content_hash": content_hash(template, parts),
+            "vectors": item_vectors
         }
-    }
+        if item.fulltext is not None:
+            record["fulltext"] = item.fulltext
+        if item.keywords is not None:
+            record["keywords"] = item.keywords
+        records.append(record)
+    return records
+
+@app.post("/templates/{template_id}", dependencies=[Depends(check_admin_token)])
+async def upsert_template(template_id: str, record: TemplateRecord):
+    """新增或覆盖一个模板，立即生效并写入追加段"""
+    records = await build_records([(template_id, record)])
+    vector_index = await run_in_threadpool(commit_ops, upsert_ops(records))
+    return {"status": "ok", "template": template_id, "count": vector_index.live_count, "generation": vector_store.generation}
+
+@app.post("/templates", dependencies=[Depends(check_admin_token)])
+async def upsert_templates(items: List[TemplateUpsert]):
+    """批量新增或覆盖模板，全部修改写入同一个段并一次更新索引"""
+    if not items:
+        return {"status": "ok", "upserted": 0, "count": vector_store.get().live_count, "generation": vector_store.generation}
+    records = await build_records([(item.template, item) for item in items])
+    vector_index = await run_in_threadpool(commit_ops, upsert_ops(records))
+    return {"status": "ok", "upserted": len(records), "count": vector_index.live_count, "generation": vector_store.generation}
+
+@app.delete("/templates/{template_id}", dependencies=[Depends(check_admin_token)])
+async def delete_template(template_id: str):
+    """删除一个模板，立即生效并写入追加段"""
+    if template_id not in vector_store.get().positions:
+        raise HTTPException(status_code=404, detail=f"模板 {template_id} 不存在")
+    vector_index = await run_in_threadpool(commit_ops, delete_ops([template_id]))
+    return {"status": "ok", "template": template_id, "count": vector_index.live_count, "generation": vector_store.generation}
+
+@app.get("/embedding_cache/stats")
+async def embedding_cache_stats():
+    """向量缓存命中统计"""
+    return embedding_client.cache.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus 格式的指标"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 @app.get("/health")
 async def health_check():
@@ -233,6 +610,9 @@ async def health_check():
     return {"status": "ok"}
 
 if __name__ == "__main__":
-    load_vector_data()
-    
-    uvicorn.run(app, host="0.0.0.0", port=8031)
\ No newline at end of file
+    if config.API_WORKERS > 1:
+        if not config.SHARED_INDEX_DIR:
+            print("警告：多个工作进程未设置 SHARED_INDEX_DIR，每个进程将各自构建一份索引")
+        uvicorn.run("api_new:app", host="0.0.0.0", port=8031, workers=config.API_WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8031)
\ No newline at end of file
@@ -0,0 +1,84 @@
+import os
+import numpy as np
+from typing import Optional
+
+# k-means 训练时最多使用的样本数，以及分块计算时每块的行数
+MAX_TRAIN_SAMPLES = 100000
+ASSIGN_CHUNK_SIZE = 65536
+
+
+def assign_to_centroids(matrix: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """分块计算每行最相似的中心，避免一次生成 n x n_lists 的大矩阵"""
+    assignments = np.empty(matrix.shape[0], dtype=np.int32)
+    for start in range(0, matrix.shape[0], ASSIGN_CHUNK_SIZE):
+        chunk = np.asarray(matrix[start:start + ASSIGN_CHUNK_SIZE], dtype=np.float32)
+        assignments[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+
+class IVFIndex:
+    """
+    倒排文件(IVF)近似最近邻索引，纯NumPy实现
+
+    用球面k-means把归一化向量划分成 n_lists 个簇，每个簇保存其行号列表
+    （CSR形式：row_ids 按簇排序，offsets[c]:offsets[c+1] 为第c个簇）。
+    查询时只取与查询最相似的 nprobe 个簇中的行作为候选，
+    nprobe 越大召回越高、耗时越长，nprobe >= n_lists 时等价于全量。
+    """
+
+    def __init__(self, centroids: np.ndarray, offsets: np.ndarray, row_ids: np.ndarray):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.row_ids = row_ids
+
+    @property
+    def n_lists(self) -> int:
+        return self.centroids.shape[0]
+
+    @classmethod
+    def build(cls, matrix: np.ndarray, n_lists: Optional[int] = None, n_iter: int = 10, seed: int = 0) -> "IVFIndex":
+        """matrix 需为按行归一化的向量矩阵"""
+        n = matrix.shape[0]
+        if n_lists is None:
+            n_lists = int(np.sqrt(n))
+        n_lists = max(1, min(n_lists, n))
+
+        rng = np.random.default_rng(seed)
+        train_rows = rng.choice(n, size=min(n, MAX_TRAIN_SAMPLES), replace=False)
+        train = np.asarray(matrix[np.sort(train_rows)], dtype=np.float32)
+        centroids = train[rng.choice(len(train), size=n_lists, replace=False)].copy()
+
+        for _ in range(n_iter):
+            assignments = assign_to_centroids(train, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, train)
+            counts = np.bincount(assignments, minlength=n_lists)
+            empty = counts == 0
+            # 空簇重新随机取一个样本作为中心
+            sums[empty] = train[rng.choice(len(train), size=int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = sums / norms
+
+        assignments = assign_to_centroids(matrix, centroids)
+        row_ids = np.argsort(assignments, kind="stable").astype(np.int32)
+        offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assignments, minlength=n_lists))
+        return cls(centroids.astype(np.float32), offsets, row_ids)
+
+    def search(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        """返回查询向量所在的 nprobe 个簇中的全部行号"""
+        if nprobe >= self.n_lists:
+            return self.row_ids
+        probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        return np.concatenate([self.row_ids[self.offsets[c]:self.offsets[c + 1]] for c in probe])
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp-{os.getpid()}.npz"
+        np.savez(tmp_path, centroids=self.centroids, offsets=self.offsets, row_ids=self.row_ids)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        with np.load(path) as data:
+            return cls(data["centroids"], data["offsets"], data["row_ids"])
@@ -0,0 +1,78 @@
+import os
+
+# 向量数据JSON文件，以及由它生成的列式二进制存储目录（存在时服务优先使用）
+VECTOR_FILE_PATH = os.environ.get("VECTOR_FILE_PATH", "/home/user/opt/ssy/contract_template/data/vector_data/vector_new.json")
+VECTOR_STORE_PATH = os.environ.get("VECTOR_STORE_PATH", "/home/user/opt/ssy/contract_template/data/vector_data/vector_new")
+
+# 合同模板docx目录，以及从中提取的模板全文（旁路sqlite存储，见 script/update_contract.py）
+TEMPLATE_DOCX_DIR = os.environ.get("TEMPLATE_DOCX_DIR", "/home/user/opt/ssy/contract_template/data/合同模板(市场监管局）")
+FULLTEXT_PATH = os.environ.get("FULLTEXT_PATH", "/home/user/opt/ssy/contract_template/data/vector_data/fulltext.db")
+
+# 本地向量服务替身（script/text2vector_stub_server.py）的监听地址和向量维度。
+# EMBEDDING_STUB=1 时所有客户端默认改用替身，便于在内网之外压测和调试
+EMBEDDING_STUB = os.environ.get("EMBEDDING_STUB", "0").lower() in ("1", "true", "yes")
+TEXT2VECTOR_STUB_HOST = os.environ.get("TEXT2VECTOR_STUB_HOST", "127.0.0.1")
+TEXT2VECTOR_STUB_PORT = int(os.environ.get("TEXT2VECTOR_STUB_PORT", "8101"))
+TEXT2VECTOR_STUB_DIM = int(os.environ.get("TEXT2VECTOR_STUB_DIM", "768"))
+TEXT2VECTOR_STUB_URL = f"http://{TEXT2VECTOR_STUB_HOST}:{TEXT2VECTOR_STUB_PORT}/text2vector/"
+
+# 向量服务地址，可通过环境变量覆盖
+TEXT2VECTOR_URL = os.environ.get("TEXT2VECTOR_URL", TEXT2VECTOR_STUB_URL if EMBEDDING_STUB else "http://192.168.10.58:8101/text2vector/")
+
+# 批量向量接口地址（请求体 {"texts": [...]}），为空表示服务只支持单条接口
+TEXT2VECTOR_BATCH_URL = os.environ.get("TEXT2VECTOR_BATCH_URL", TEXT2VECTOR_STUB_URL + "batch/" if EMBEDDING_STUB else "") or None
+
+# 批量请求每批最多条数，以及每批文本总字符数上限（近似token预算）
+EMBEDDING_MAX_BATCH_SIZE = int(os.environ.get("EMBEDDING_MAX_BATCH_SIZE", "32"))
+EMBEDDING_MAX_BATCH_CHARS = int(os.environ.get("EMBEDDING_MAX_BATCH_CHARS", "16000"))
+
+# 向量服务请求超时（秒）
+EMBEDDING_TIMEOUT = float(os.environ.get("EMBEDDING_TIMEOUT", "30"))
+EMBEDDING_CONNECT_TIMEOUT = float(os.environ.get("EMBEDDING_CONNECT_TIMEOUT", "5"))
+
+# 连接池大小与同时进行的向量请求上限
+EMBEDDING_MAX_CONNECTIONS = int(os.environ.get("EMBEDDING_MAX_CONNECTIONS", "32"))
+EMBEDDING_MAX_CONCURRENCY = int(os.environ.get("EMBEDDING_MAX_CONCURRENCY", "16"))
+
+# 向量模型标识，参与缓存键计算，更换模型后旧缓存自动失效
+EMBEDDING_MODEL_ID = os.environ.get("EMBEDDING_MODEL_ID", "text2vector")
+
+# 向量缓存：内存条数上限、过期时间（秒，为空表示不过期）、持久化sqlite文件路径（为空表示只用内存）
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", "10000"))
+EMBEDDING_CACHE_TTL = float(os.environ["EMBEDDING_CACHE_TTL"]) if os.environ.get("EMBEDDING_CACHE_TTL") else None
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH") or None
+
+# 查询返回的模板数量：默认值与上限
+DEFAULT_TOP_K = int(os.environ.get("DEFAULT_TOP_K", "3"))
+MAX_TOP_K = int(os.environ.get("MAX_TOP_K", "50"))
+
+# 近似最近邻索引每个字段探测的簇数，越大召回越高、越慢；为0时不使用近似索引
+ANN_NPROBE = int(os.environ.get("ANN_NPROBE", "8"))
+
+# 全文BM25索引文件（由 script/build_lexical_index.py 生成），以及混合检索中词法分数的权重：
+# 归一化到[0,1]的BM25分数乘以该权重后加到总分上，为0时只用向量分数
+LEXICAL_INDEX_PATH = os.environ.get("LEXICAL_INDEX_PATH", "/home/user/opt/ssy/contract_template/data/vector_data/lexical_index.npz")
+LEXICAL_WEIGHT = float(os.environ.get("LEXICAL_WEIGHT", "0"))
+
+# 关键词候选过滤：off 不过滤；union 召回任一字段命中关键词的模板；intersect 要求每个命中了关键词的字段都匹配。
+# 候选数少于 max(top_k, KEYWORD_MIN_CANDIDATES) 时依次放宽为 union、不过滤
+KEYWORD_FILTER = os.environ.get("KEYWORD_FILTER", "off")
+KEYWORD_MIN_CANDIDATES = int(os.environ.get("KEYWORD_MIN_CANDIDATES", "20"))
+
+# 服务内存中向量矩阵的精度：float32 / float16 / int8（int8 每行带缩放系数）
+VECTOR_DTYPE = os.environ.get("VECTOR_DTYPE", "float32")
+
+# 管理接口（增删模板、重新加载）的访问令牌，通过请求头 X-Admin-Token 传入；为空时管理接口全部拒绝
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN") or None
+
+# 管理接口修改后自动合并：已删除行占比或未合并的段数超过阈值时在后台合并并重建索引
+COMPACT_DELETED_RATIO = float(os.environ.get("COMPACT_DELETED_RATIO", "0.2"))
+COMPACT_MAX_SEGMENTS = int(os.environ.get("COMPACT_MAX_SEGMENTS", "200"))
+
+# 查询接口是否返回 Server-Timing 响应头（各阶段耗时，浏览器开发者工具中可直接查看）
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "0").lower() in ("1", "true", "yes")
+
+# 服务的工作进程数，以及多进程共享的索引快照目录（建议放在 /dev/shm 下）：
+# 设置后只由一个进程构建索引，各进程以只读内存映射共用同一份向量矩阵；为空时每个进程各自加载
+API_WORKERS = int(os.environ.get("API_WORKERS", "1"))
+SHARED_INDEX_DIR = os.environ.get("SHARED_INDEX_DIR") or None
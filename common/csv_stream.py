@@ -0,0 +1,70 @@
+import csv
+import io
+import os
+import sys
+from typing import Iterator, List, Optional, Union
+
+
+class _CountingReader(io.RawIOBase):
+    """记录已从底层文件读取的字节数"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes_read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.raw.read(len(buffer))
+        size = len(data)
+        buffer[:size] = data
+        self.bytes_read += size
+        return size
+
+
+class CSVStream:
+    """
+    单遍读取一个或多个CSV文件（"-" 表示标准输入），把它们当作一个连续的行流
+
+    has_header=True 时跳过每个文件的首行，第一个文件的首行保存在 header 中。
+    进度按已读取的字节数计算：bytes_read 为已读字节，total_bytes 为全部文件大小
+    （含标准输入时为 None），不需要为了统计行数预先扫描一遍文件。
+    """
+
+    def __init__(self, paths: Union[str, List[str]], encoding: str = "utf-8-sig", has_header: bool = True):
+        self.paths = [paths] if isinstance(paths, str) else list(paths)
+        self.encoding = encoding
+        self.has_header = has_header
+        self.header = None
+        self._finished_bytes = 0
+        self._current = None
+
+    @property
+    def total_bytes(self) -> Optional[int]:
+        if "-" in self.paths:
+            return None
+        return sum(os.path.getsize(path) for path in self.paths)
+
+    @property
+    def bytes_read(self) -> int:
+        current = self._current.bytes_read if self._current is not None else 0
+        return self._finished_bytes + current
+
+    def __iter__(self) -> Iterator[List[str]]:
+        for path in self.paths:
+            raw = sys.stdin.buffer if path == "-" else open(path, "rb")
+            self._current = _CountingReader(raw)
+            try:
+                text = io.TextIOWrapper(io.BufferedReader(self._current), encoding=self.encoding, newline="")
+                reader = csv.reader(text)
+                if self.has_header:
+                    header = next(reader, None)
+                    if self.header is None:
+                        self.header = header
+                yield from reader
+            finally:
+                self._finished_bytes += self._current.bytes_read
+                self._current = None
+                if path != "-":
+                    raw.close()
@@ -0,0 +1,129 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+import numpy as np
+from collections import OrderedDict
+from typing import List, Optional
+
+from common import config
+
+
+def normalize_text(text: str) -> str:
+    """统一全半角、合并空白，作为缓存键的文本"""
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class EmbeddingCache:
+    """
+    向量缓存
+
+    内存中按LRU淘汰（max_size 条，可选 ttl 秒过期），向量以 float32 数组保存，
+    每条约为 Python 浮点数列表的 1/8。指定 persist_path 时同时写入本地 sqlite 文件，
+    重启后仍可命中：put() 只记下待写入的条目，由 flush() 一次批量提交（客户端在线程池中调用，
+    不阻塞事件循环）。键为 模型标识 + 归一化文本 的 sha1。
+    线程安全，可同时用于 API 和入库脚本。
+    """
+
+    def __init__(self, max_size: int = config.EMBEDDING_CACHE_SIZE,
+                 ttl: Optional[float] = config.EMBEDDING_CACHE_TTL,
+                 persist_path: Optional[str] = config.EMBEDDING_CACHE_PATH,
+                 model_id: str = config.EMBEDDING_MODEL_ID):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.model_id = model_id
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._db = None
+        if persist_path:
+            self._db = sqlite3.connect(persist_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embedding_cache (key TEXT PRIMARY KEY, vector BLOB, created REAL)"
+            )
+            self._db.commit()
+
+    def key(self, text: str) -> str:
+        return hashlib.sha1(f"{self.model_id}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def get(self, text: str) -> Optional[List[float]]:
+        key = self.key(text)
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and self._expired(item[1]):
+                del self._items[key]
+                item = None
+
+            if item is None and self._db is not None:
+                with self._db_lock:
+                    row = self._db.execute(
+                        "SELECT vector, created FROM embedding_cache WHERE key = ?", (key,)
+                    ).fetchone()
+                if row is not None and not self._expired(row[1]):
+                    item = (np.frombuffer(row[0], dtype=np.float32), row[1])
+                    self._store(key, item)
+
+            if item is None:
+                self.misses += 1
+                return None
+
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0].tolist()
+
+    def _store(self, key: str, item):
+        self._items[key] = item
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def put(self, text: str, vector: List[float]):
+        key = self.key(text)
+        created = time.time()
+        vector = np.array(vector, dtype=np.float32)
+        with self._lock:
+            self._store(key, (vector, created))
+            if self._db is not None:
+                self._pending[key] = (vector.tobytes(), created)
+
+    @property
+    def pending_writes(self) -> int:
+        """尚未写入 sqlite 的条数"""
+        return len(self._pending)
+
+    def flush(self):
+        """把 put() 积累的条目一次写入 sqlite 并提交"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending or self._db is None:
+            return
+        with self._db_lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embedding_cache (key, vector, created) VALUES (?, ?, ?)",
+                ((key, vector, created) for key, (vector, created) in pending.items())
+            )
+            self._db.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+    def close(self):
+        self.flush()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
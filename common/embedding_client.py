@@ -0,0 +1,214 @@
+import asyncio
+import random
+import time
+import httpx
+from typing import Any, List, Optional, Union
+
+from common import config
+from common.embedding_cache import EmbeddingCache
+from common.metrics import EMBEDDING_ERRORS, EMBEDDING_REQUEST_SECONDS
+from common.rate_limit import TokenBucket
+
+# 这些状态码视为临时错误，可以重试
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# 批量接口返回这些状态码时认为服务不支持批量，之后改为逐条请求
+BATCH_UNSUPPORTED_STATUS_CODES = (404, 405, 422)
+
+
+class EmbeddingServiceError(Exception):
+    """向量服务请求失败"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def chunk_texts(texts: List[str], max_batch_size: int, max_batch_chars: int) -> List[List[str]]:
+    """按条数和总字符数（近似token预算）切分批次，单条超长文本单独成批"""
+    chunks = []
+    current = []
+    current_chars = 0
+    for text in texts:
+        if current and (len(current) >= max_batch_size or current_chars + len(text) > max_batch_chars):
+            chunks.append(current)
+            current = []
+            current_chars = 0
+        current.append(text)
+        current_chars += len(text)
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def parse_vector(response_data: Any) -> Any:
+    if isinstance(response_data, dict) and "result" in response_data:
+        return response_data["result"]
+    return response_data
+
+
+class EmbeddingClient:
+    """
+    异步向量服务客户端
+
+    复用同一个连接池（keep-alive），并用信号量限制同时发往向量服务的请求数，
+    不会阻塞事件循环。需在应用启动时 start()，关闭时 close()。
+    传入 cache 时先查缓存，未命中才请求向量服务，新向量写入持久化缓存的操作在线程池中批量提交。
+    retries > 0 时对网络错误和临时错误状态码按指数退避重试；
+    传入 rate_limiter 时每次请求前先取令牌（用于批量入库）。
+
+    get_vectors() 一次获取多条文本的向量：配置了 batch_url 时按批次大小和字符预算
+    切分后每批一次请求，请求体为 {"texts": [...]}，返回 {"result": [[...], ...]}；
+    未配置或服务不支持批量时退回逐条并发请求当前的单条接口。
+    """
+
+    def __init__(self, api_url: str = config.TEXT2VECTOR_URL,
+                 timeout: float = config.EMBEDDING_TIMEOUT,
+                 connect_timeout: float = config.EMBEDDING_CONNECT_TIMEOUT,
+                 max_connections: int = config.EMBEDDING_MAX_CONNECTIONS,
+                 max_concurrency: int = config.EMBEDDING_MAX_CONCURRENCY,
+                 cache: Optional[EmbeddingCache] = None,
+                 retries: int = 0,
+                 retry_backoff: float = 0.5,
+                 rate_limiter: Optional[TokenBucket] = None,
+                 batch_url: Optional[str] = config.TEXT2VECTOR_BATCH_URL,
+                 max_batch_size: int = config.EMBEDDING_MAX_BATCH_SIZE,
+                 max_batch_chars: int = config.EMBEDDING_MAX_BATCH_CHARS):
+        self.api_url = api_url
+        self.cache = cache
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.rate_limiter = rate_limiter
+        self.batch_url = batch_url
+        self.max_batch_size = max_batch_size
+        self.max_batch_chars = max_batch_chars
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.max_concurrency = max_concurrency
+        self._client = None
+        self._semaphore = None
+
+    async def start(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _post(self, url: str, payload: dict) -> Any:
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire()
+        endpoint = "batch" if url == self.batch_url else "single"
+        async with self._semaphore:
+            start = time.perf_counter()
+            try:
+                response = await self._client.post(url, json=payload)
+            except httpx.HTTPError as e:
+                EMBEDDING_ERRORS.inc(endpoint=endpoint, status="error")
+                raise EmbeddingServiceError(f"向量服务请求异常: {e!r}")
+            finally:
+                EMBEDDING_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+
+        if response.status_code != 200:
+            EMBEDDING_ERRORS.inc(endpoint=endpoint, status=response.status_code)
+            raise EmbeddingServiceError(f"向量服务请求失败: {response.text}", status_code=response.status_code)
+        return response.json()
+
+    async def _post_with_retry(self, url: str, payload: dict) -> Any:
+        await self.start()
+        for attempt in range(self.retries + 1):
+            try:
+                return await self._post(url, payload)
+            except EmbeddingServiceError as e:
+                retryable = e.status_code is None or e.status_code in RETRY_STATUS_CODES
+                if not retryable or attempt == self.retries:
+                    raise
+                # 指数退避并加随机抖动，避免大量请求同时重试
+                await asyncio.sleep(self.retry_backoff * (2 ** attempt) * (0.5 + random.random()))
+
+    async def _flush_cache(self):
+        if self.cache is not None and self.cache.pending_writes:
+            await asyncio.get_running_loop().run_in_executor(None, self.cache.flush)
+
+    async def get_vector(self, text: str) -> List[float]:
+        if self.cache is not None:
+            vector = self.cache.get(text)
+            if vector is not None:
+                return vector
+        vector = await self._fetch_one(text)
+        await self._flush_cache()
+        return vector
+
+    async def _fetch_one(self, text: str) -> List[float]:
+        """请求单条接口并写入缓存，不查缓存（调用方已查过，避免重复计入未命中）"""
+        vector = parse_vector(await self._post_with_retry(self.api_url, {"text": text}))
+        if self.cache is not None:
+            self.cache.put(text, vector)
+        return vector
+
+    async def _get_batch(self, texts: List[str]) -> List[List[float]]:
+        vectors = parse_vector(await self._post_with_retry(self.batch_url, {"texts": texts}))
+        if not isinstance(vectors, list) or len(vectors) != len(texts):
+            raise EmbeddingServiceError(f"批量向量服务返回数量不一致: 请求 {len(texts)} 条")
+        if self.cache is not None:
+            for text, vector in zip(texts, vectors):
+                self.cache.put(text, vector)
+        return vectors
+
+    async def _get_chunk(self, texts: List[str]) -> List[Union[List[float], Exception]]:
+        if self.batch_url:
+            try:
+                return await self._get_batch(texts)
+            except EmbeddingServiceError as e:
+                if e.status_code not in BATCH_UNSUPPORTED_STATUS_CODES:
+                    return [e] * len(texts)
+                print(f"向量服务不支持批量接口（状态码 {e.status_code}），改为逐条请求")
+                self.batch_url = None
+        return await asyncio.gather(*(self._fetch_one(text) for text in texts), return_exceptions=True)
+
+    async def get_vectors(self, texts: List[str], return_exceptions: bool = False) -> List[Union[List[float], Exception]]:
+        """
+        获取多条文本的向量，结果与 texts 一一对应
+
+        先查缓存，重复文本只请求一次。return_exceptions=True 时失败的文本位置
+        返回异常对象而不是直接抛出，便于调用方只跳过失败的部分。
+        """
+        vectors = {}
+        missing = []
+        for text in dict.fromkeys(texts):
+            vector = self.cache.get(text) if self.cache is not None else None
+            if vector is not None:
+                vectors[text] = vector
+            else:
+                missing.append(text)
+
+        if missing:
+            if self.batch_url:
+                chunks = chunk_texts(missing, self.max_batch_size, self.max_batch_chars)
+            else:
+                chunks = [missing]
+            results = await asyncio.gather(*(self._get_chunk(chunk) for chunk in chunks))
+            for chunk, chunk_results in zip(chunks, results):
+                vectors.update(zip(chunk, chunk_results))
+            await self._flush_cache()
+
+        result = [vectors[text] for text in texts]
+        if not return_exceptions:
+            for vector in result:
+                if isinstance(vector, Exception):
+                    raise vector
+        return result
+
+
+def embed_texts(texts: List[str], **client_kwargs) -> List[Union[List[float], Exception]]:
+    """供同步脚本使用：新建客户端获取一组文本的向量，失败的位置为异常对象"""
+    async def run():
+        client = EmbeddingClient(**client_kwargs)
+        try:
+            return await client.get_vectors(texts, return_exceptions=True)
+        finally:
+            await client.close()
+    return asyncio.run(run())
@@ -0,0 +1,58 @@
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from common import config
+
+
+class FulltextStore:
+    """
+    模板全文的旁路存储
+
+    sqlite 表 fulltext(template, text, path, mtime_ns, size)，以模板名为主键，
+    与向量数据分开保存，更新全文不需要改写向量JSON。同时记录提取时源文件的
+    (path, mtime_ns, size)，文件没有变化时可以跳过重新提取。
+    """
+
+    def __init__(self, path: str = config.FULLTEXT_PATH):
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS fulltext "
+            "(template TEXT PRIMARY KEY, text TEXT, path TEXT, mtime_ns INTEGER, size INTEGER)"
+        )
+        self._db.commit()
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM fulltext").fetchone()[0]
+
+    def get(self, template: str) -> str:
+        row = self._db.execute("SELECT text FROM fulltext WHERE template = ?", (template,)).fetchone()
+        return row[0] if row is not None else ""
+
+    def items(self) -> Dict[str, str]:
+        """template -> 全文"""
+        return dict(self._db.execute("SELECT template, text FROM fulltext"))
+
+    def sources(self) -> Dict[str, Tuple[str, int, int]]:
+        """template -> 提取时源文件的 (path, mtime_ns, size)"""
+        return {row[0]: tuple(row[1:]) for row in self._db.execute("SELECT template, path, mtime_ns, size FROM fulltext")}
+
+    def put_many(self, rows: Iterable[Tuple[str, str, Optional[str], Optional[int], Optional[int]]]):
+        """写入 (template, text, path, mtime_ns, size)，同名模板覆盖"""
+        self._db.executemany(
+            "INSERT OR REPLACE INTO fulltext (template, text, path, mtime_ns, size) VALUES (?, ?, ?, ?, ?)",
+            rows
+        )
+        self._db.commit()
+
+    def delete_many(self, templates: Iterable[str]):
+        self._db.executemany("DELETE FROM fulltext WHERE template = ?", ((template,) for template in templates))
+        self._db.commit()
+
+    def templates(self) -> List[str]:
+        return [row[0] for row in self._db.execute("SELECT template FROM fulltext")]
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
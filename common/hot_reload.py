@@ -0,0 +1,102 @@
+import os
+import threading
+import time
+from typing import Any, Callable, Optional, Tuple
+
+
+def file_signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class HotReloader:
+    """
+    按文件变化热加载数据
+
+    启动时同步加载一次，之后通过 get() 按 check_interval 检查文件的 mtime/size，
+    发现变化时在后台线程中重新构建，构建完成后整体替换引用。
+    正在处理的请求持有的是旧快照，不会看到加载到一半的数据；
+    重新加载失败时保留旧数据继续服务。
+
+    signature 可以替换默认的 (mtime, size) 检查，例如同时检查追加段目录；
+    调用方自己增量更新了数据时用 replace() 直接换上新快照。
+    """
+
+    def __init__(self, path: str, loader: Callable[[str], Any], check_interval: float = 5.0,
+                 signature: Callable[[str], Any] = file_signature):
+        self.path = path
+        self.loader = loader
+        self.check_interval = check_interval
+        self.signature_fn = signature
+        self.current = None
+        self.generation = 0
+        self.loaded_signature = None
+        # 最近一次加载的耗时（秒）与失败的后台加载次数
+        self.load_seconds = None
+        self.failures = 0
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self._reloading = False
+
+    def signature(self) -> Any:
+        return self.signature_fn(self.path)
+
+    def load(self) -> Any:
+        """
+        同步加载并替换当前快照
+
+        加载期间快照被 replace() 或另一次加载换过时（代数变化），丢弃这次基于旧数据的结果、
+        返回当前快照，避免覆盖刚生效的增量修改；文件仍有变化时下次检查会重新加载。
+        """
+        with self._lock:
+            generation = self.generation
+        signature = self.signature()
+        start = time.perf_counter()
+        value = self.loader(self.path)
+        with self._lock:
+            if self.generation != generation:
+                print(f"加载 {self.path} 期间数据已更新，丢弃本次加载结果")
+                return self.current
+            self.current = value
+            self.loaded_signature = signature
+            self.load_seconds = time.perf_counter() - start
+            self.generation += 1
+        return value
+
+    def replace(self, value: Any, signature: Any = None):
+        """
+        直接替换当前快照（调用方已把修改同时写入文件并增量更新了数据）
+
+        signature 为新快照对应的文件签名，避免之后再为这次修改重新加载一遍；
+        为None时保留原签名，下次检查发现文件变化会重新加载。
+        """
+        with self._lock:
+            self.current = value
+            if signature is not None:
+                self.loaded_signature = signature
+            self.generation += 1
+
+    def _background_load(self):
+        try:
+            self.load()
+            print(f"检测到文件 {self.path} 变化，已重新加载")
+        except Exception as e:
+            self.failures += 1
+            print(f"重新加载 {self.path} 失败，继续使用旧数据: {e}")
+        finally:
+            self._reloading = False
+
+    def get(self) -> Any:
+        """返回当前快照，必要时触发后台重新加载"""
+        now = time.monotonic()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            if self.signature() != self.loaded_signature:
+                with self._lock:
+                    if not self._reloading:
+                        self._reloading = True
+                        threading.Thread(target=self._background_load, daemon=True).start()
+        return self.current
@@ -0,0 +1,142 @@
+import os
+import re
+import unicodedata
+import numpy as np
+from collections import Counter
+from typing import Dict, List
+
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 连续的汉字按字符二元组切分，字母数字串整体作为一个词
+TOKEN_PATTERN = re.compile(r"[\u4e00-\u9fff]+|[0-9a-z]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    中文按字符二元组（bigram）切词，不依赖分词词典
+
+    统一全半角和大小写后，每段连续汉字切成重叠的二元组（只有一个字时取单字），
+    字母数字串整体作为一个词，其余字符忽略。
+    """
+    tokens = []
+    for run in TOKEN_PATTERN.findall(unicodedata.normalize("NFKC", text).lower()):
+        if run[0].isascii() or len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class BM25Index:
+    """
+    模板文本的BM25倒排索引
+
+    每个模板一篇文档（全文 + 四个部分），词表中第t个词的倒排表为
+    doc_ids/term_freqs[offsets[t]:offsets[t+1]]（CSR形式，词频用uint16存储）。
+    查询时只访问查询中出现的词的倒排表，向量化计算全部文档的BM25分数。
+    """
+
+    def __init__(self, templates: List[str], terms: List[str], offsets: np.ndarray, doc_ids: np.ndarray,
+                 term_freqs: np.ndarray, doc_lengths: np.ndarray):
+        self.templates = templates
+        self.terms = terms
+        self.vocab = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+
+        n = len(templates)
+        doc_freqs = np.diff(offsets)
+        self.idf = np.log1p((n - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+        average_length = float(doc_lengths.mean()) if n and doc_lengths.sum() else 1.0
+        self.length_norm = (BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths / average_length)).astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.templates)
+
+    @property
+    def nbytes(self) -> int:
+        return self.offsets.nbytes + self.doc_ids.nbytes + self.term_freqs.nbytes + self.doc_lengths.nbytes
+
+    @classmethod
+    def build(cls, documents: Dict[str, str]) -> "BM25Index":
+        """documents 为 template -> 文本"""
+        vocab = {}
+        term_ids = []
+        doc_ids = []
+        term_freqs = []
+        doc_lengths = np.zeros(len(documents), dtype=np.int32)
+        for doc, text in enumerate(documents.values()):
+            tokens = tokenize(text)
+            doc_lengths[doc] = len(tokens)
+            counts = Counter(tokens)
+            term_ids.append(np.fromiter((vocab.setdefault(term, len(vocab)) for term in counts), dtype=np.int32, count=len(counts)))
+            term_freqs.append(np.fromiter(counts.values(), dtype=np.int64, count=len(counts)))
+            doc_ids.append(np.full(len(counts), doc, dtype=np.int32))
+
+        term_ids = np.concatenate(term_ids) if term_ids else np.zeros(0, dtype=np.int32)
+        order = np.argsort(term_ids, kind="stable")
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(term_ids, minlength=len(vocab)))
+        return cls(
+            templates=list(documents),
+            terms=list(vocab),
+            offsets=offsets,
+            doc_ids=np.concatenate(doc_ids)[order] if doc_ids else np.zeros(0, dtype=np.int32),
+            term_freqs=np.minimum(np.concatenate(term_freqs)[order], np.iinfo(np.uint16).max).astype(np.uint16)
+            if term_freqs else np.zeros(0, dtype=np.uint16),
+            doc_lengths=doc_lengths
+        )
+
+    def scores(self, query: str) -> np.ndarray:
+        """查询与每篇文档的BM25分数，查询中重复的词只计一次"""
+        scores = np.zeros(len(self), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.doc_ids[start:end]
+            freqs = self.term_freqs[start:end].astype(np.float32)
+            scores[docs] += self.idf[term_id] * freqs * (BM25_K1 + 1) / (freqs + self.length_norm[docs])
+        return scores
+
+    def doc_rows(self, positions: Dict[str, int]) -> np.ndarray:
+        """每篇文档在向量索引中的行号（positions 为 template -> 行号），不在索引中的为 -1"""
+        return np.fromiter((positions.get(template, -1) for template in self.templates),
+                           dtype=np.int64, count=len(self.templates))
+
+    def save(self, path: str):
+        """词表和模板名各以换行拼接成一个字符串保存，比定长字符串数组小得多"""
+        tmp_path = f"{path}.tmp-{os.getpid()}.npz"
+        np.savez(
+            tmp_path,
+            templates=np.frombuffer("\n".join(self.templates).encode("utf-8"), dtype=np.uint8),
+            terms=np.frombuffer("\n".join(self.terms).encode("utf-8"), dtype=np.uint8),
+            offsets=self.offsets,
+            doc_ids=self.doc_ids,
+            term_freqs=self.term_freqs,
+            doc_lengths=self.doc_lengths
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with np.load(path) as data:
+            doc_lengths = data["doc_lengths"]
+            templates = data["templates"].tobytes().decode("utf-8").split("\n") if len(doc_lengths) else []
+            terms = data["terms"].tobytes().decode("utf-8").split("\n") if len(data["offsets"]) > 1 else []
+            return cls(templates, terms, data["offsets"], data["doc_ids"], data["term_freqs"], doc_lengths)
+
+
+def template_documents(records: List[Dict], fulltexts: Dict[str, str]) -> Dict[str, str]:
+    """每个模板的检索文本：全文加四个部分，全文存储中没有时使用记录自带的 fulltext 字段"""
+    documents = {}
+    for item in records:
+        template = item.get("template", "")
+        parts = item.get("parts", {})
+        documents[template] = "\n".join([fulltexts.get(template) or item.get("fulltext", "")] + [parts.get(field, "") for field in sorted(parts)])
+    return documents
@@ -0,0 +1,32 @@
+import asyncio
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    异步令牌桶限流
+
+    每秒补充 rate 个令牌，最多累积 burst 个；acquire() 在没有令牌时等待。
+    rate <= 0 表示不限流。
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: float = 1.0):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
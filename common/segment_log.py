@@ -0,0 +1,243 @@
+import glob
+import json
+import os
+import shutil
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from common import config
+from common.hot_reload import file_signature
+from common.vector_store import columnar_options, is_columnar_store, save_columnar
+
+# 段文件中每行一个操作：
+#   {"op": "upsert", "record": {...}}   按 template 覆盖或新增
+#   {"op": "delete", "template": "..."} 删除
+#   {"op": "patch", "template": "...", "fields": {...}}  只修改记录的部分字段
+#   {"op": "reset"}                     清空之前的全部数据（覆盖模式写入时使用）
+RESET_OP = {"op": "reset"}
+
+_sequence = 0
+
+
+def segment_dir(output_file: str) -> str:
+    return output_file + ".segments"
+
+
+def metadata_file(output_file: str) -> str:
+    """不含向量的记录文件，与 output_file 对应，用于只需要主键和元数据的场景"""
+    return output_file + ".records.json"
+
+
+def upsert_ops(records: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{"op": "upsert", "record": record} for record in records]
+
+
+def delete_ops(templates: Iterable[str]) -> List[Dict[str, Any]]:
+    return [{"op": "delete", "template": template} for template in templates]
+
+
+def patch_ops(patches: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{"op": "patch", "template": template, "fields": fields} for template, fields in patches.items()]
+
+
+def patch_record(record: Dict[str, Any], fields: Dict[str, Any]) -> Dict[str, Any]:
+    """返回修改后的新记录，字典类型的字段（如 vectors）按子字段合并"""
+    patched = dict(record)
+    for key, value in fields.items():
+        if isinstance(value, dict) and isinstance(patched.get(key), dict):
+            patched[key] = dict(patched[key], **value)
+        else:
+            patched[key] = value
+    return patched
+
+
+def append_segment(output_file: str, ops: List[Dict[str, Any]]) -> str:
+    """
+    把一批操作写成一个新的段文件
+
+    先写临时文件再改名，段文件要么完整出现要么不存在。
+    文件名按 时间戳-进程号-序号 排序即为写入顺序。
+    """
+    global _sequence
+    directory = segment_dir(output_file)
+    os.makedirs(directory, exist_ok=True)
+    _sequence += 1
+    name = f"{time.time_ns():020d}-{os.getpid()}-{_sequence:06d}.jsonl"
+    tmp_path = os.path.join(directory, "." + name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for op in ops:
+            f.write(json.dumps(op, ensure_ascii=False) + "\n")
+    path = os.path.join(directory, name)
+    os.replace(tmp_path, path)
+    return path
+
+
+def list_segments(output_file: str) -> List[str]:
+    return sorted(glob.glob(os.path.join(segment_dir(output_file), "*.jsonl")))
+
+
+def apply_ops(records: Dict[str, Dict[str, Any]], ops: Iterable[Dict[str, Any]]):
+    """按顺序把操作应用到以 template 为键的记录表上"""
+    for op in ops:
+        if op["op"] == "upsert":
+            record = op["record"]
+            records[record.get("template")] = record
+        elif op["op"] == "delete":
+            records.pop(op["template"], None)
+        elif op["op"] == "patch":
+            record = records.get(op["template"])
+            if record is not None:
+                records[op["template"]] = patch_record(record, op["fields"])
+        elif op["op"] == "reset":
+            records.clear()
+
+
+def reduce_ops(ops: Iterable[Dict[str, Any]]) -> Tuple[bool, Dict[str, Tuple[str, Any]]]:
+    """
+    把一串操作归并为每个模板的最终变化，便于一次性应用到内存索引（VectorIndex.apply_changes）
+
+    返回 (是否包含reset, template -> ("upsert", 记录) / ("delete", None) / ("patch", 字段))。
+    reset 之后的 patch 只作用于 reset 之后写入的记录。
+    """
+    reset = False
+    changes = {}
+    for op in ops:
+        if op["op"] == "upsert":
+            changes[op["record"].get("template")] = ("upsert", op["record"])
+        elif op["op"] == "delete":
+            changes[op["template"]] = ("delete", None)
+        elif op["op"] == "patch":
+            kind, data = changes.get(op["template"], (None, None))
+            if kind == "upsert":
+                changes[op["template"]] = ("upsert", patch_record(data, op["fields"]))
+            elif kind == "patch":
+                changes[op["template"]] = ("patch", patch_record(data, op["fields"]))
+            elif kind is None and not reset:
+                changes[op["template"]] = ("patch", op["fields"])
+        elif op["op"] == "reset":
+            reset = True
+            changes.clear()
+    return reset, changes
+
+
+def read_ops(path: str) -> Iterable[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def load_base(output_file: str) -> List[Dict[str, Any]]:
+    try:
+        with open(output_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def without_vectors(record: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in record.items() if key != "vectors"}
+
+
+def save_base_metadata(output_file: str, records: List[Dict[str, Any]]):
+    """写出 output_file 当前内容去掉向量后的记录，并记下 output_file 的 (mtime, size)"""
+    tmp_path = f"{metadata_file(output_file)}.tmp-{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"source": file_signature(output_file), "records": [without_vectors(item) for item in records]},
+                  f, ensure_ascii=False)
+    os.replace(tmp_path, metadata_file(output_file))
+
+
+def load_base_metadata(output_file: str) -> List[Dict[str, Any]]:
+    """
+    读取已合并数据中不含向量的记录
+
+    元数据文件对应的 (mtime, size) 与 output_file 一致时直接读取，不解析向量；
+    不存在或已过期时读取完整文件，并顺便重新生成元数据文件。
+    """
+    source = file_signature(output_file)
+    if source is None:
+        return []
+    try:
+        with open(metadata_file(output_file), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("source") == list(source):
+            return meta["records"]
+    except (OSError, ValueError):
+        pass
+
+    records = load_base(output_file)
+    try:
+        save_base_metadata(output_file, records)
+    except OSError as e:
+        print(f"写入元数据文件 {metadata_file(output_file)} 失败: {e}")
+    return [without_vectors(item) for item in records]
+
+
+def replay_records(output_file: str, vectors: bool = True) -> List[Dict[str, Any]]:
+    """
+    读取已合并的数据并重放尚未合并的段，得到当前完整数据
+
+    vectors=False 时已合并的部分从元数据文件读取，结果中不含向量，
+    只需要主键、分类、内容哈希等字段时不必解析全部向量。
+    """
+    base = load_base(output_file) if vectors else load_base_metadata(output_file)
+    records = {item.get("template"): item for item in base}
+    for path in list_segments(output_file):
+        apply_ops(records, read_ops(path))
+    if not vectors:
+        return [without_vectors(item) for item in records.values()]
+    return list(records.values())
+
+
+def serving_columnar_path(output_file: str) -> Optional[str]:
+    """
+    output_file 是服务读取的数据文件、且服务使用的列式存储存在时返回该存储目录
+
+    服务优先加载 config.VECTOR_STORE_PATH，只从 output_file 重放追加段，
+    合并删除段时必须同时重建这份列式存储，否则段中的修改会从服务中消失。
+    """
+    if os.path.abspath(output_file) != os.path.abspath(config.VECTOR_FILE_PATH):
+        return None
+    return config.VECTOR_STORE_PATH if is_columnar_store(config.VECTOR_STORE_PATH) else None
+
+
+def compact(output_file: str, columnar_path: Optional[str] = None, dtype: Optional[str] = None,
+            ann: Optional[bool] = None) -> List[Dict[str, Any]]:
+    """
+    把段合并进服务使用的格式
+
+    读取一次 output_file，按顺序重放全部段，写出新的 output_file（临时文件改名，
+    原文件保留一份 .bak），指定 columnar_path 时同时生成列式存储（ann=True 时包括近似索引），
+    最后删除已合并的段。columnar_path 为空时，若 output_file 是服务读取的数据文件，
+    则重建服务使用的列式存储（见 serving_columnar_path）。dtype、ann 为空时沿用
+    columnar_path 处已有存储的精度和近似索引，避免合并后 float16 存储变回 float32、近似索引丢失。
+    """
+    segments = list_segments(output_file)
+    if not segments and os.path.exists(output_file) and columnar_path is None:
+        return load_base(output_file)
+    columnar_path = columnar_path or serving_columnar_path(output_file)
+
+    records = {item.get("template"): item for item in load_base(output_file)}
+    for path in segments:
+        apply_ops(records, read_ops(path))
+    data = list(records.values())
+
+    tmp_path = f"{output_file}.tmp-{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    if os.path.exists(output_file):
+        shutil.copy2(output_file, output_file + ".bak")
+    os.replace(tmp_path, output_file)
+    save_base_metadata(output_file, data)
+
+    if columnar_path:
+        existing_dtype, existing_ann = columnar_options(columnar_path)
+        dtype = dtype or existing_dtype
+        ann = existing_ann if ann is None else ann
+        save_columnar(data, columnar_path, dtype=dtype, ann=ann)
+
+    for path in segments:
+        os.remove(path)
+    print(f"已合并 {len(segments)} 个段，共 {len(data)} 条记录，保存至 {output_file}")
+    return data
@@ -0,0 +1,300 @@
+import fcntl
+import json
+import os
+import shutil
+import numpy as np
+from contextlib import contextmanager
+from numpy.lib.format import open_memmap
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from common.ann_index import IVFIndex
+from common.vector_index import FIELDS, VectorIndex
+
+CURRENT_FILE = "CURRENT"
+LOCK_FILE = ".lock"
+SNAPSHOT_META_FILE = "meta.json"
+# 完整快照全部行的元数据单独保存，meta.json 保持很小，每次修改读取当前代时不必解析
+RECORDS_FILE = "records.json"
+# 完整快照的矩阵文件预留的空行：行数的1/4，至少这么多行
+MIN_HEADROOM_ROWS = 1024
+# 连续的增量快照超过这个数时重新发布完整快照，避免映射时要读的增量太多
+MAX_DELTA_GENERATIONS = 256
+
+
+def _normalize_signature(signature: Any) -> Any:
+    """签名经 JSON 保存后元组变为列表，比较前统一转换"""
+    return json.loads(json.dumps(signature))
+
+
+def _row_meta(vector_index: VectorIndex, row: int) -> Dict[str, Any]:
+    return {"template": vector_index.templates[row], "template1": vector_index.template1[row],
+            "template2": vector_index.template2[row], "keywords": vector_index.keywords[row]}
+
+
+class SharedIndexStore:
+    """
+    多个服务进程共享的只读索引快照
+
+    每一代快照是 root 下的一个目录 gen-<代数>，CURRENT 文件记录当前代数，原子替换。
+    完整快照保存服务精度的向量矩阵、缩放系数、近似索引（.npy）以及模板名、分类、关键词等元数据，
+    矩阵文件按行数预留约1/4的空行。各进程以内存映射方式打开矩阵，共用同一份页缓存，
+    内存不随进程数增加（root 放在 /dev/shm 下时即为共享内存）。
+
+    管理接口的修改发布为增量快照：apply_changes() 把新行直接追加到完整快照矩阵文件的空行中
+    （映射的追加缓冲区），增量快照只保存新增行和修改了分类、关键词的行的元数据，以及墓碑掩码，
+    一次修改的写入量与修改的行数成正比，而不是重写全部矩阵。映射一代快照时从它所基于的完整快照
+    开始依次应用各代增量；空行用完或增量代数过多时重新发布完整快照。
+    映射旧一代的进程只读取自己那一代的行数，不受之后追加的行影响。
+
+    构建和发布在文件锁内进行：数据变化后第一个拿到锁的进程构建并发布新一代，
+    其余进程发现当前代对应的源数据签名与自己看到的一致，直接映射，不再重复构建。
+    发布完整快照后删除之前各代的目录，仍在映射它们的进程不受影响，直到换上新快照。
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    @contextmanager
+    def locked(self):
+        """进程间的排他锁，同一进程内不可嵌套使用"""
+        with open(os.path.join(self.root, LOCK_FILE), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def generation_path(self, generation: int) -> str:
+        return os.path.join(self.root, f"gen-{generation}")
+
+    def current_generation(self) -> Optional[int]:
+        try:
+            with open(os.path.join(self.root, CURRENT_FILE), "r") as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def read_meta(self, generation: int) -> dict:
+        with open(os.path.join(self.generation_path(generation), SNAPSHOT_META_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def current_meta(self) -> Optional[dict]:
+        generation = self.current_generation()
+        if generation is None:
+            return None
+        try:
+            return self.read_meta(generation)
+        except OSError:
+            return None
+
+    def matches(self, signature: Any) -> bool:
+        """当前代是否由 signature 对应的源数据构建"""
+        meta = self.current_meta()
+        return meta is not None and meta.get("signature") == _normalize_signature(signature)
+
+    def _write_generation(self, generation: int, write: Callable[[str], None]):
+        """在临时目录中写好一代快照再改名，最后替换 CURRENT"""
+        path = self.generation_path(generation)
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+        write(tmp_path)
+        os.rename(tmp_path, path)
+
+        current_tmp = os.path.join(self.root, f"{CURRENT_FILE}.tmp-{os.getpid()}")
+        with open(current_tmp, "w") as f:
+            f.write(str(generation))
+        os.replace(current_tmp, os.path.join(self.root, CURRENT_FILE))
+
+    def publish(self, vector_index: VectorIndex, signature: Any) -> int:
+        """把索引写成新一代完整快照并设为当前代，返回代数。需在 locked() 内调用"""
+        generation = (self.current_generation() or 0) + 1
+        count = len(vector_index)
+        capacity = count + max(count // 4, MIN_HEADROOM_ROWS)
+
+        def write(path):
+            for field in FIELDS:
+                matrix = vector_index.matrices[field]
+                # 预留的空行不写入，/dev/shm 下不占内存
+                buffer = open_memmap(os.path.join(path, f"{field}.npy"), mode="w+", dtype=matrix.dtype,
+                                     shape=(capacity,) + matrix.shape[1:])
+                buffer[:count] = matrix
+                del buffer
+                if field in vector_index.scales:
+                    buffer = open_memmap(os.path.join(path, f"{field}.scales.npy"), mode="w+", dtype=np.float32,
+                                         shape=(capacity,))
+                    buffer[:count] = vector_index.scales[field]
+                    del buffer
+                if vector_index.ann is not None:
+                    ann = vector_index.ann[field]
+                    for name in ("centroids", "offsets", "row_ids"):
+                        np.save(os.path.join(path, f"ivf_{field}.{name}.npy"), getattr(ann, name))
+            if vector_index.deleted is not None:
+                np.save(os.path.join(path, "deleted.npy"), vector_index.deleted)
+
+            meta = {
+                "generation": generation,
+                "base": generation,
+                "depth": 0,
+                "signature": signature,
+                "count": count,
+                "capacity": capacity,
+                "dtype": vector_index.dtype,
+                "ann": vector_index.ann is not None,
+                "ann_size": vector_index.ann_size
+            }
+            with open(os.path.join(path, RECORDS_FILE), "w", encoding="utf-8") as f:
+                json.dump([_row_meta(vector_index, row) for row in range(count)], f, ensure_ascii=False)
+            with open(os.path.join(path, SNAPSHOT_META_FILE), "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+
+        self._write_generation(generation, write)
+        for name in os.listdir(self.root):
+            if name.startswith("gen-") and name != f"gen-{generation}":
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+        return generation
+
+    def _appended_in_place(self, vector_index: VectorIndex, meta: dict) -> bool:
+        """索引的矩阵是否仍是当前代所基于的完整快照文件（新行已追加在文件的空行中）"""
+        if len(vector_index) > meta.get("capacity", meta["count"]) or meta.get("depth", 0) >= MAX_DELTA_GENERATIONS:
+            return False
+        base_path = self.generation_path(meta.get("base", meta["generation"]))
+        for field in FIELDS:
+            arrays = [(vector_index.matrices[field], f"{field}.npy")]
+            if field in vector_index.scales:
+                arrays.append((vector_index.scales[field], f"{field}.scales.npy"))
+            for array, name in arrays:
+                if getattr(array, "filename", None) != os.path.join(base_path, name):
+                    return False
+        return True
+
+    def publish_delta(self, vector_index: VectorIndex, signature: Any, previous: VectorIndex) -> int:
+        """
+        把在当前代上 apply_changes() 得到的索引发布为增量快照，返回代数。需在 locked() 内调用
+
+        新行的向量已经写在完整快照的矩阵文件中，这里只保存元数据的变化和墓碑掩码。
+        """
+        parent = self.current_generation()
+        meta = self.read_meta(parent)
+        generation = parent + 1
+        old_count = len(previous)
+        # apply_changes() 只替换修改过的行，未修改的行是同一个对象，先比较身份
+        rows = zip(previous.template1, vector_index.template1, previous.template2, vector_index.template2,
+                   previous.keywords, vector_index.keywords)
+        changed = {
+            str(row): _row_meta(vector_index, row)
+            for row, (old1, new1, old2, new2, old_keywords, new_keywords) in enumerate(rows)
+            if (old1 is not new1 and old1 != new1) or (old2 is not new2 and old2 != new2)
+            or (old_keywords is not new_keywords and old_keywords != new_keywords)
+        }
+
+        def write(path):
+            if vector_index.deleted is not None:
+                np.save(os.path.join(path, "deleted.npy"), vector_index.deleted)
+            delta = {
+                "generation": generation,
+                "base": meta.get("base", parent),
+                "parent": parent,
+                "depth": meta.get("depth", 0) + 1,
+                "signature": signature,
+                "count": len(vector_index),
+                "capacity": meta.get("capacity", meta["count"]),
+                "dtype": vector_index.dtype,
+                "ann": vector_index.ann is not None,
+                "ann_size": vector_index.ann_size,
+                "changed": changed,
+                "appended": [_row_meta(vector_index, row) for row in range(old_count, len(vector_index))]
+            }
+            with open(os.path.join(path, SNAPSHOT_META_FILE), "w", encoding="utf-8") as f:
+                json.dump(delta, f, ensure_ascii=False)
+
+        self._write_generation(generation, write)
+        return generation
+
+    def _records(self, meta: dict) -> List[Dict[str, Any]]:
+        """从完整快照开始依次应用增量，得到这一代全部行的元数据"""
+        chain = [meta]
+        while "parent" in chain[-1]:
+            chain.append(self.read_meta(chain[-1]["parent"]))
+        with open(os.path.join(self.generation_path(chain[-1]["generation"]), RECORDS_FILE), "r", encoding="utf-8") as f:
+            records = json.load(f)
+        for delta in reversed(chain[:-1]):
+            for row, item in delta["changed"].items():
+                records[int(row)] = item
+            records.extend(delta["appended"])
+        return records
+
+    def attach(self, generation: Optional[int] = None) -> Tuple[int, VectorIndex]:
+        """
+        以内存映射打开某一代（默认当前代）快照。需在 locked() 内调用，避免映射时被删除
+
+        查询用的矩阵是只读映射的前 count 行；追加缓冲区是同一文件的可写映射，
+        在当前代上 apply_changes() 时新行直接写入文件的空行。
+        """
+        generation = self.current_generation() if generation is None else generation
+        path = self.generation_path(generation)
+        meta = self.read_meta(generation)
+        base_path = self.generation_path(meta.get("base", generation))
+        count = meta["count"]
+
+        def load(directory, name, mmap_mode="r"):
+            file = os.path.join(directory, f"{name}.npy")
+            return np.load(file, mmap_mode=mmap_mode) if os.path.exists(file) else None
+
+        matrices = {field: load(base_path, field)[:count] for field in FIELDS}
+        scales = {field: load(base_path, f"{field}.scales")[:count] for field in FIELDS
+                  if os.path.exists(os.path.join(base_path, f"{field}.scales.npy"))}
+        storage = {
+            "length": count,
+            "matrices": {field: load(base_path, field, "r+") for field in FIELDS},
+            "scales": {field: load(base_path, f"{field}.scales", "r+") for field in scales}
+        }
+        ann = None
+        if meta["ann"]:
+            ann = {field: IVFIndex(load(base_path, f"ivf_{field}.centroids"), load(base_path, f"ivf_{field}.offsets"),
+                                   load(base_path, f"ivf_{field}.row_ids"))
+                   for field in FIELDS}
+        records = self._records(meta)
+        vector_index = VectorIndex(
+            templates=[item["template"] for item in records],
+            template1=[item["template1"] for item in records],
+            template2=[item["template2"] for item in records],
+            matrices=matrices,
+            ann=ann,
+            scales=scales,
+            deleted=load(path, "deleted", None),
+            ann_size=meta["ann_size"],
+            storage=storage,
+            keywords=[item["keywords"] for item in records]
+        )
+        return generation, vector_index
+
+    def load(self, signature: Callable[[], Any], build: Callable[[], VectorIndex]) -> Tuple[int, VectorIndex]:
+        """
+        取与源数据签名一致的快照
+
+        拿到锁后调用 signature() 读取源数据签名，与当前代的签名相同时直接映射；否则调用 build()
+        构建索引，发布为新一代后再映射。构建期间其他进程等待锁，拿到锁后映射这一代即可。
+        """
+        with self.locked():
+            current_signature = signature()
+            if not self.matches(current_signature):
+                self.publish(build(), current_signature)
+            return self.attach()
+
+    def share(self, vector_index: VectorIndex, signature: Any,
+              previous: Optional[Tuple[int, VectorIndex]] = None) -> Tuple[int, VectorIndex]:
+        """
+        发布进程内增量更新得到的索引。需在 locked() 内调用
+
+        previous 为修改所基于的 (代数, 索引)。它是当前代、且新行已追加在完整快照文件中时
+        发布增量快照，直接返回 vector_index；否则发布完整快照并映射回来。
+        """
+        meta = self.current_meta()
+        if (previous is not None and meta is not None and previous[0] == meta["generation"]
+                and self._appended_in_place(vector_index, meta)):
+            return self.publish_delta(vector_index, signature, previous[1]), vector_index
+        generation = self.publish(vector_index, signature)
+        return self.attach(generation)
@@ -0,0 +1,137 @@
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from common import config
+from common.csv_stream import CSVStream
+from common.segment_log import (append_segment, compact, delete_ops, patch_ops, patch_record, replay_records,
+                                upsert_ops, without_vectors)
+
+# 可以单独修改的字段；修改 parts 会使向量和内容哈希失效，需用 upsert 写入整条记录
+PATCH_FIELDS = ("template1", "template2", "fulltext", "keywords", "vectors")
+
+
+class TemplateStore:
+    """
+    以 template 为主键的向量数据存储
+
+    打开时读取一次已合并的数据并重放尚未合并的段，建立 template -> 记录 的字典索引，
+    之后的查找、upsert、delete、patch 都是 O(1)。默认只读取不含向量的元数据文件
+    （compact() 时生成），删除或修改一个模板不需要解析全部向量，get() 返回的记录不含向量；
+    需要读取已有向量时以 vectors=True 打开。修改先作用于内存中的记录并记下对应操作，
+    commit() 把这些操作写成一个追加段，只包含变化的记录，不重写整个文件。
+    服务和 embedding 脚本读到的是 compact() 合并后的文件，也可以之后用
+    script/compact_vector_store.py 统一合并。
+
+    用作上下文管理器时，正常退出会自动 commit()。
+    """
+
+    def __init__(self, path: str = config.VECTOR_FILE_PATH, vectors: bool = False):
+        self.path = path
+        self.vectors = vectors
+        self.records = {item.get("template"): item for item in replay_records(path, vectors=vectors)}
+        self._pending = []
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __contains__(self, template: str) -> bool:
+        return template in self.records
+
+    def __enter__(self) -> "TemplateStore":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+
+    def get(self, template: str) -> Optional[Dict[str, Any]]:
+        return self.records.get(template)
+
+    def upsert(self, record: Dict[str, Any]):
+        self.upsert_many([record])
+
+    def upsert_many(self, records: Iterable[Dict[str, Any]]):
+        records = list(records)
+        for record in records:
+            self.records[record.get("template")] = record if self.vectors else without_vectors(record)
+        self._pending.extend(upsert_ops(records))
+
+    def delete(self, template: str) -> bool:
+        return not self.delete_many([template])
+
+    def delete_many(self, templates: Iterable[str]) -> List[str]:
+        """删除多条记录，返回不存在的模板名"""
+        deleted = []
+        missing = []
+        for template in templates:
+            if self.records.pop(template, None) is None:
+                missing.append(template)
+            else:
+                deleted.append(template)
+        self._pending.extend(delete_ops(deleted))
+        return missing
+
+    def patch(self, template: str, **fields) -> bool:
+        return not self.patch_many({template: fields})
+
+    def patch_many(self, patches: Dict[str, Dict[str, Any]]) -> List[str]:
+        """
+        修改多条记录的部分字段，返回不存在的模板名
+
+        只能修改 PATCH_FIELDS 中的字段，vectors、keywords 按子字段合并（可以只替换某一部分）。
+        值与现有记录相同的修改会被忽略，不写入段；未读取向量时无法比较，修改 vectors 总是写入。
+        """
+        changed = {}
+        missing = []
+        for template, fields in patches.items():
+            invalid = set(fields) - set(PATCH_FIELDS)
+            if invalid:
+                raise ValueError(f"不支持修改字段: {', '.join(sorted(invalid))}")
+            record = self.records.get(template)
+            if record is None:
+                missing.append(template)
+                continue
+            patched = patch_record(record, fields)
+            if patched != record or ("vectors" in fields and not self.vectors):
+                self.records[template] = patched if self.vectors else without_vectors(patched)
+                changed[template] = fields
+        self._pending.extend(patch_ops(changed))
+        return missing
+
+    @property
+    def pending(self) -> int:
+        """尚未写入段的操作数"""
+        return len(self._pending)
+
+    def commit(self) -> Optional[str]:
+        """把未写入的操作写成一个追加段，没有修改时不写文件"""
+        if not self._pending:
+            return None
+        path = append_segment(self.path, self._pending)
+        self._pending = []
+        return path
+
+    def compact(self, columnar_path: Optional[str] = None, dtype: Optional[str] = None,
+                ann: Optional[bool] = None) -> List[Dict[str, Any]]:
+        """写入未提交的操作并把全部段合并进 JSON 文件（可同时生成列式存储，默认沿用已有存储的精度和近似索引）"""
+        self.commit()
+        return compact(self.path, columnar_path=columnar_path, dtype=dtype, ann=ann)
+
+
+def read_csv_column(csv_path: str, key_column: int, value_column: Optional[int] = None,
+                    encoding: str = "utf-8-sig") -> Tuple[Dict[str, Optional[str]], Set[str]]:
+    """
+    从CSV（跳过表头）读取 模板名 -> 值 的映射，用于批量修改或删除
+
+    value_column 为空时值为 None。返回 (映射, 重复出现的模板名)，重复时后出现的值覆盖前面的值。
+    """
+    values = {}
+    duplicates = set()
+    max_col = max(key_column, value_column if value_column is not None else 0)
+    for row in CSVStream(csv_path, encoding=encoding):
+        if len(row) <= max_col or not row[key_column]:
+            continue
+        key = row[key_column]
+        if key in values:
+            duplicates.add(key)
+        values[key] = row[value_column] if value_column is not None else None
+    return values, duplicates
@@ -0,0 +1,148 @@
+import asyncio
+import hashlib
+import math
+import random
+import numpy as np
+from typing import List, Optional
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from common import config
+from common.lexical_index import tokenize
+
+# 每个词散列到向量中的位置数
+HASH_POSITIONS = 4
+# 支持的延迟分布
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal", "exponential")
+
+
+class TextRequest(BaseModel):
+    text: str
+
+
+class BatchRequest(BaseModel):
+    texts: List[str]
+
+
+def stub_vector(text: str, dim: int = config.TEXT2VECTOR_STUB_DIM) -> List[float]:
+    """
+    确定性的散列向量：文本切词后每个词散列到 HASH_POSITIONS 个位置（带正负号）累加，再归一化
+
+    相同文本得到相同向量，共享词越多的文本余弦相似度越高，不依赖模型和网络。
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for token in tokenize(text) or [text]:
+        digest = hashlib.blake2b(token.encode("utf-8"), digest_size=4 * HASH_POSITIONS).digest()
+        for value in np.frombuffer(digest, dtype=np.uint32):
+            vector[value % dim] += 1.0 if value & 0x80000000 else -1.0
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm > 0 else vector).tolist()
+
+
+class LatencyModel:
+    """
+    每次请求注入的延迟（秒）
+
+    latency 为延迟的均值（lognormal 时为中位数），jitter 为离散程度：
+        fixed        始终为 latency
+        uniform      在 [latency - jitter, latency + jitter] 中均匀分布
+        normal       均值 latency、标准差 jitter（截断到0）
+        lognormal    中位数 latency、对数标准差 jitter，长尾，接近线上的尾延迟
+        exponential  均值 latency
+    per_text 为批量请求中每条文本额外增加的延迟。
+    """
+
+    def __init__(self, latency: float = 0.0, distribution: str = "fixed", jitter: float = 0.0,
+                 per_text: float = 0.0, seed: Optional[int] = None):
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"不支持的延迟分布: {distribution}")
+        self.latency = latency
+        self.distribution = distribution
+        self.jitter = jitter
+        self.per_text = per_text
+        self.rng = random.Random(seed)
+
+    def sample(self, texts: int = 1) -> float:
+        if self.latency <= 0:
+            base = 0.0
+        elif self.distribution == "uniform":
+            base = self.rng.uniform(self.latency - self.jitter, self.latency + self.jitter)
+        elif self.distribution == "normal":
+            base = self.rng.gauss(self.latency, self.jitter)
+        elif self.distribution == "lognormal":
+            base = self.latency * math.exp(self.rng.gauss(0.0, self.jitter))
+        elif self.distribution == "exponential":
+            base = self.rng.expovariate(1.0 / self.latency)
+        else:
+            base = self.latency
+        return max(0.0, base) + self.per_text * texts
+
+
+def create_app(dim: int = config.TEXT2VECTOR_STUB_DIM, latency: float = 0.0, latency_dist: str = "fixed",
+               latency_jitter: float = 0.0, latency_per_text: float = 0.0, error_rate: float = 0.0,
+               error_status: int = 503, max_concurrency: int = 0, queue_limit: int = 0,
+               batch: bool = True, seed: Optional[int] = None) -> FastAPI:
+    """
+    与向量服务接口相同的本地替身：/text2vector/ 返回 {"result": [...]}，
+    /text2vector/batch/ 接收 {"texts": [...]} 返回 {"result": [[...], ...]}。
+
+    可以注入：
+        延迟        见 LatencyModel
+        错误        每个请求以 error_rate 的概率返回 error_status（默认503，客户端会重试）
+        并发上限    同时最多处理 max_concurrency 个请求（0 为不限），其余排队；
+                    排队数超过 queue_limit（0 为不限）时直接返回 429
+        批量接口    batch=False 时批量接口返回 404，客户端退回逐条请求
+    相同 seed 下注入的延迟和错误序列可以复现。/stats 返回请求计数和最大并发数。
+    """
+    app = FastAPI(title="text2vector 本地替身")
+    latency_model = LatencyModel(latency, latency_dist, latency_jitter, latency_per_text, seed=seed)
+    error_rng = random.Random(seed)
+    semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+    stats = {"requests": 0, "texts": 0, "errors": 0, "rejected": 0, "in_flight": 0, "max_in_flight": 0, "queued": 0}
+
+    async def handle(texts: List[str]):
+        stats["requests"] += 1
+        if semaphore is not None and semaphore.locked() and queue_limit > 0 and stats["queued"] >= queue_limit:
+            stats["rejected"] += 1
+            return JSONResponse(status_code=429, content={"detail": "向量服务繁忙"})
+        stats["queued"] += 1
+        try:
+            if semaphore is not None:
+                await semaphore.acquire()
+        finally:
+            stats["queued"] -= 1
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        try:
+            delay = latency_model.sample(len(texts))
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if error_rate > 0 and error_rng.random() < error_rate:
+                stats["errors"] += 1
+                return JSONResponse(status_code=error_status, content={"detail": "注入的错误"})
+            stats["texts"] += len(texts)
+            return [stub_vector(text, dim) for text in texts]
+        finally:
+            stats["in_flight"] -= 1
+            if semaphore is not None:
+                semaphore.release()
+
+    @app.post("/text2vector/")
+    async def text2vector(request: TextRequest):
+        result = await handle([request.text])
+        return result if isinstance(result, JSONResponse) else {"result": result[0]}
+
+    @app.post("/text2vector/batch/")
+    async def text2vector_batch(request: BatchRequest):
+        if not batch:
+            return JSONResponse(status_code=404, content={"detail": "Not Found"})
+        result = await handle(request.texts)
+        return result if isinstance(result, JSONResponse) else {"result": result}
+
+    @app.get("/stats")
+    async def stub_stats():
+        return dict(stats)
+
+    return app
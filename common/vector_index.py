@@ -0,0 +1,565 @@
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple
+
+FIELDS = ("text1", "text2", "text3", "text4")
+
+CATEGORY_FIELDS = ("template1", "template2")
+
+# 内存中向量矩阵支持的精度：float16 直接存储，int8 每行附带一个缩放系数
+QUANTIZE_DTYPES = ("float32", "float16", "int8")
+
+# 非float32矩阵打分时每次转换的行数，临时内存约为 SCORE_CHUNK_SIZE x dim x 4 字节
+SCORE_CHUNK_SIZE = 16384
+
+FIELD_WEIGHTS = {
+    "text1": 27.6,
+    "text2": 27.6,
+    "text3": 18.4,
+    "text4": 18.4
+}
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """按行做L2归一化，零向量保持为零"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def quantize_matrix(matrix: np.ndarray, dtype: str):
+    """
+    把归一化矩阵转换为指定精度，返回 (矩阵, 每行缩放系数)
+
+    int8 按每行最大绝对值缩放到 [-127, 127]，还原值为 matrix_int8 * scale；
+    其他精度不需要缩放系数，返回 None。
+    """
+    if dtype not in QUANTIZE_DTYPES:
+        raise ValueError(f"不支持的向量精度: {dtype}")
+    if dtype != "int8":
+        return np.asarray(matrix).astype(dtype, copy=False), None
+
+    scales = np.zeros(matrix.shape[0], dtype=np.float32)
+    quantized = np.zeros(matrix.shape, dtype=np.int8)
+    for start in range(0, matrix.shape[0], SCORE_CHUNK_SIZE):
+        block = np.asarray(matrix[start:start + SCORE_CHUNK_SIZE], dtype=np.float32)
+        block_scales = np.abs(block).max(axis=1) / 127 if block.shape[1] else np.zeros(len(block), dtype=np.float32)
+        block_scales[block_scales == 0] = 1.0
+        quantized[start:start + len(block)] = np.round(block / block_scales[:, None])
+        scales[start:start + len(block)] = block_scales
+    return quantized, scales
+
+
+def quantized_dot(query: np.ndarray, matrix: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    计算 query @ matrix.T
+
+    float32 矩阵直接用BLAS；float16/int8 矩阵按块临时转换为float32再相乘，
+    不会为整个矩阵生成float32副本。int8 结果再乘以每行的缩放系数。
+    """
+    if matrix.dtype == np.float32:
+        result = query @ matrix.T
+    else:
+        result = np.empty(query.shape[:-1] + (matrix.shape[0],), dtype=np.float32)
+        for start in range(0, matrix.shape[0], SCORE_CHUNK_SIZE):
+            block = np.asarray(matrix[start:start + SCORE_CHUNK_SIZE], dtype=np.float32)
+            result[..., start:start + len(block)] = query @ block.T
+    if scales is not None:
+        result *= scales
+    return result
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    取分数最高的k个下标（降序）
+
+    先用 partition 以 O(n) 求出第k大的分数，取所有更高分的行，剩余名额按下标顺序
+    由恰好等于第k大分数的行补齐，再只对这k个排序；
+    分数相同时下标小的在前，与稳定排序结果一致（包括第k名处的并列）。
+    """
+    scores = np.asarray(scores)
+    n = scores.shape[0]
+    if k <= 0 or n == 0:
+        return np.zeros(0, dtype=np.int64)
+    if k >= n:
+        candidates = np.arange(n)
+    else:
+        kth = -np.partition(-scores, k - 1)[k - 1]
+        if np.isnan(kth):
+            # 有效分数不足k个，NaN 排在最后
+            above, ties = np.flatnonzero(~np.isnan(scores)), np.flatnonzero(np.isnan(scores))
+        else:
+            above, ties = np.flatnonzero(scores > kth), np.flatnonzero(scores == kth)
+        candidates = np.concatenate([above, ties[:k - len(above)]])
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order]
+
+
+def append_rows(buffer: np.ndarray, length: int, rows: np.ndarray) -> np.ndarray:
+    """
+    把 rows 写到 buffer[length:] 并返回缓冲区
+
+    容量不足或缓冲区只读（如内存映射）时按约1.25倍扩容后拷贝，
+    多次追加的均摊开销与追加的行数成正比。buffer[:length] 的内容不会被修改。
+    """
+    needed = length + len(rows)
+    if buffer.shape[0] < needed or not buffer.flags.writeable:
+        grown = np.empty((max(needed + needed // 4, 64),) + buffer.shape[1:], dtype=buffer.dtype)
+        grown[:length] = buffer[:length]
+        buffer = grown
+    buffer[length:needed] = rows
+    return buffer
+
+
+def records_to_matrices(records: List[Dict[str, Any]], dim: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """把记录中的向量按字段堆叠成归一化矩阵，缺失或维度不一致的向量置零；dim 为空时取第一个向量的维度"""
+    dim = dim or 0
+    for item in records:
+        if dim:
+            break
+        for vector in item.get("vectors", {}).values():
+            if vector:
+                dim = len(vector)
+                break
+
+    matrices = {}
+    for field in FIELDS:
+        matrix = np.zeros((len(records), dim), dtype=np.float32)
+        for row, item in enumerate(records):
+            vector = item.get("vectors", {}).get(field)
+            if vector and len(vector) == dim:
+                matrix[row] = vector
+        matrices[field] = normalize_rows(matrix)
+    return matrices
+
+
+class CategoryIndex:
+    """
+    分类字段的倒排索引
+
+    加载时把分类字符串编码为整数，并按编码对行号排序（CSR形式），
+    查询某个分类的全部行、统计各分类数量都不需要逐条比较字符串。
+    编码为 -1 的行（已删除的行）不属于任何分类。
+    """
+
+    def __init__(self, values: List[str], vocab: Optional[Dict[str, int]] = None,
+                 codes: Optional[np.ndarray] = None):
+        if codes is None:
+            vocab = {}
+            codes = np.fromiter((vocab.setdefault(value, len(vocab)) for value in values),
+                                dtype=np.int32, count=len(values))
+        self.vocab = vocab
+        self.codes = codes
+        live = codes >= 0
+        self.row_ids = np.argsort(codes, kind="stable").astype(np.int32)[len(codes) - int(live.sum()):]
+        self.offsets = np.zeros(len(self.vocab) + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum(np.bincount(codes[live], minlength=len(self.vocab)))
+
+    def rows(self, value: str) -> np.ndarray:
+        code = self.vocab.get(value)
+        if code is None:
+            return np.zeros(0, dtype=np.int32)
+        return self.row_ids[self.offsets[code]:self.offsets[code + 1]]
+
+    def counts(self) -> Dict[str, int]:
+        sizes = np.diff(self.offsets)
+        return {value: int(sizes[code]) for value, code in self.vocab.items() if sizes[code]}
+
+    def updated(self, changes: Dict[int, Optional[str]], appended: List[str]) -> "CategoryIndex":
+        """返回修改了部分行（值为 None 表示删除）并追加新行后的索引，只对整数编码重新排序"""
+        vocab = dict(self.vocab)
+        codes = np.concatenate([self.codes, np.zeros(len(appended), dtype=np.int32)])
+        for row, value in changes.items():
+            codes[row] = -1 if value is None else vocab.setdefault(value, len(vocab))
+        for offset, value in enumerate(appended):
+            codes[len(self.codes) + offset] = vocab.setdefault(value, len(vocab))
+        return CategoryIndex([], vocab=vocab, codes=codes)
+
+
+class KeywordIndex:
+    """
+    多值关键词字段的倒排索引
+
+    每行可以有多个关键词，(关键词编码, 行号) 对按编码排序保存（CSR形式），
+    rows() 直接取某个关键词的全部行。match() 在查询文本中查找词表中出现的关键词：
+    只枚举词表中出现过的关键词长度的子串查字典，不需要逐个关键词扫描文本。
+    """
+
+    def __init__(self, keywords: List[List[str]], vocab: Optional[Dict[str, int]] = None,
+                 codes: Optional[np.ndarray] = None, row_ids: Optional[np.ndarray] = None):
+        if codes is None:
+            vocab = {}
+            pair_codes = []
+            pair_rows = []
+            for row, row_keywords in enumerate(keywords):
+                for keyword in row_keywords:
+                    pair_codes.append(vocab.setdefault(keyword, len(vocab)))
+                    pair_rows.append(row)
+            order = np.argsort(np.asarray(pair_codes, dtype=np.int32), kind="stable")
+            codes = np.asarray(pair_codes, dtype=np.int32)[order]
+            row_ids = np.asarray(pair_rows, dtype=np.int32)[order]
+        self.vocab = vocab
+        self.codes = codes
+        self.row_ids = row_ids
+        self.offsets = np.searchsorted(codes, np.arange(len(vocab) + 1))
+        self.lengths = sorted({len(keyword) for keyword in vocab if keyword}, reverse=True)
+
+    def __len__(self) -> int:
+        return len(self.vocab)
+
+    def rows(self, keyword: str) -> np.ndarray:
+        code = self.vocab.get(keyword)
+        if code is None:
+            return np.zeros(0, dtype=np.int32)
+        return self.row_ids[self.offsets[code]:self.offsets[code + 1]]
+
+    def match(self, text: str) -> List[str]:
+        """文本中出现的全部关键词（按首次出现的位置排序）"""
+        found = {}
+        for length in self.lengths:
+            for start in range(len(text) - length + 1):
+                keyword = text[start:start + length]
+                if keyword in self.vocab and keyword not in found:
+                    found[keyword] = start
+        return sorted(found, key=found.get)
+
+    def updated(self, changes: Dict[int, Optional[List[str]]], appended: List[List[str]], start_row: int) -> "KeywordIndex":
+        """
+        返回替换了部分行的关键词（None 表示删除）并从 start_row 起追加新行后的索引
+
+        去掉变化行原有的 (编码, 行号) 对，新的对按编码插入到有序数组中，不重新排序。
+        """
+        vocab = dict(self.vocab)
+        codes = self.codes
+        row_ids = self.row_ids
+        if changes:
+            keep = ~np.isin(row_ids, np.fromiter(changes, dtype=np.int32, count=len(changes)))
+            codes = codes[keep]
+            row_ids = row_ids[keep]
+
+        added = [(row, row_keywords) for row, row_keywords in changes.items() if row_keywords]
+        added += [(start_row + offset, row_keywords) for offset, row_keywords in enumerate(appended)]
+        new_codes = [vocab.setdefault(keyword, len(vocab)) for _, row_keywords in added for keyword in row_keywords]
+        if new_codes:
+            new_codes = np.asarray(new_codes, dtype=np.int32)
+            new_rows = np.fromiter((row for row, row_keywords in added for _ in row_keywords), dtype=np.int32, count=len(new_codes))
+            order = np.argsort(new_codes, kind="stable")
+            at = np.searchsorted(codes, new_codes[order], side="right")
+            codes = np.insert(codes, at, new_codes[order])
+            row_ids = np.insert(row_ids, at, new_rows[order])
+        return KeywordIndex([], vocab=vocab, codes=codes, row_ids=row_ids)
+
+
+class VectorIndex:
+    """
+    模板向量的内存索引
+
+    加载时为每个字段(text1..text4)构建一个L2归一化的float32矩阵，
+    查询时只需每个字段一次矩阵-向量乘法即可得到全部模板的余弦相似度。
+    缺失或维度不一致的向量按零向量处理，相似度为0。
+    矩阵也可以是 float16 或 int8（scales 为每行缩放系数），见 quantize()。
+
+    索引本身不可变，apply_changes() 返回增量修改后的新索引：新行追加在矩阵末尾，
+    删除和替换只把旧行标记为已删除（deleted 为墓碑掩码），已删除的行不参与排序，
+    需要时整体重建即可去掉墓碑。
+    """
+
+    def __init__(self, templates: List[str], template1: List[str], template2: List[str],
+                 matrices: Dict[str, np.ndarray], ann: Optional[Dict[str, Any]] = None,
+                 scales: Optional[Dict[str, np.ndarray]] = None, deleted: Optional[np.ndarray] = None,
+                 ann_size: Optional[int] = None, positions: Optional[Dict[str, int]] = None,
+                 storage: Optional[Dict[str, Any]] = None, categories: Optional[Dict[str, CategoryIndex]] = None,
+                 keywords: Optional[List[Dict[str, List[str]]]] = None,
+                 keyword_index: Optional[Dict[str, KeywordIndex]] = None):
+        self.templates = templates
+        self.template1 = template1
+        self.template2 = template2
+        self.matrices = matrices
+        self.scales = scales or {}
+        # 每个字段的近似最近邻索引（common.ann_index.IVFIndex），为None时全量计算
+        self.ann = ann
+        # 近似索引覆盖的行数，之后追加的行总是作为候选
+        self.ann_size = len(templates) if ann_size is None else ann_size
+        # 已删除行的掩码，为None表示没有删除
+        self.deleted = deleted
+        self._positions = positions
+        # 追加新行用的缓冲区（容量可大于当前行数），由同一份数据派生的索引共享，
+        # length 记录最新一份索引的行数，只有最新的索引可以直接在缓冲区末尾追加
+        self._storage = storage or {"length": len(templates), "matrices": dict(matrices), "scales": dict(self.scales)}
+        self.categories = categories or {field: self._build_category_index(getattr(self, field)) for field in CATEGORY_FIELDS}
+        # 每行各字段的关键词（入库CSV中的关键词列），以及每个字段的关键词倒排索引
+        self.keywords = keywords if keywords is not None else [{} for _ in templates]
+        self.keyword_index = keyword_index or {field: self._build_keyword_index(field) for field in FIELDS}
+
+    def _build_keyword_index(self, field: str) -> KeywordIndex:
+        deleted = self.deleted.tolist() if self.deleted is not None else [False] * len(self.keywords)
+        return KeywordIndex([
+            row_keywords.get(field, ()) if not row_deleted else ()
+            for row_keywords, row_deleted in zip(self.keywords, deleted)
+        ])
+
+    @property
+    def has_keywords(self) -> bool:
+        return any(len(index) for index in self.keyword_index.values())
+
+    def _build_category_index(self, values: List[str]) -> CategoryIndex:
+        index = CategoryIndex(values)
+        if self.deleted is not None:
+            index = index.updated({int(row): None for row in np.flatnonzero(self.deleted)}, [])
+        return index
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]]) -> "VectorIndex":
+        return cls(
+            templates=[item.get("template", "") for item in records],
+            template1=[item.get("template1", "") for item in records],
+            template2=[item.get("template2", "") for item in records],
+            matrices=records_to_matrices(records),
+            keywords=[item.get("keywords") or {} for item in records]
+        )
+
+    @classmethod
+    def from_columnar(cls, meta: Dict[str, Any], matrices: Dict[str, np.ndarray],
+                      ann: Optional[Dict[str, Any]] = None) -> "VectorIndex":
+        """由列式存储构建，已归一化的float32/float16矩阵直接使用（可为内存映射），不做拷贝"""
+        if not meta.get("normalized"):
+            matrices = {field: normalize_rows(matrices[field]) for field in FIELDS}
+        records = meta["records"]
+        return cls(
+            templates=[item.get("template", "") for item in records],
+            template1=[item.get("template1", "") for item in records],
+            template2=[item.get("template2", "") for item in records],
+            matrices=matrices,
+            ann=ann,
+            keywords=[item.get("keywords") or {} for item in records]
+        )
+
+    def __len__(self) -> int:
+        """矩阵行数，包括已删除的行"""
+        return len(self.templates)
+
+    @property
+    def live_count(self) -> int:
+        """未删除的模板数"""
+        if self.deleted is None:
+            return len(self)
+        return len(self) - int(self.deleted.sum())
+
+    @property
+    def positions(self) -> Dict[str, int]:
+        """template -> 行号，只包含未删除的行"""
+        if self._positions is None:
+            self._positions = {
+                template: row for row, template in enumerate(self.templates)
+                if self.deleted is None or not self.deleted[row]
+            }
+        return self._positions
+
+    @property
+    def dtype(self) -> str:
+        return self.matrices[FIELDS[0]].dtype.name
+
+    @property
+    def nbytes(self) -> int:
+        """向量矩阵及缩放系数占用的字节数"""
+        return sum(matrix.nbytes for matrix in self.matrices.values()) + \
+            sum(scales.nbytes for scales in self.scales.values())
+
+    def quantize(self, dtype: str) -> "VectorIndex":
+        """返回使用指定精度矩阵的新索引，精度相同时返回自身"""
+        if dtype == self.dtype:
+            return self
+        matrices = {}
+        scales = {}
+        for field in FIELDS:
+            matrix = self.matrices[field]
+            if field in self.scales:
+                matrix = np.asarray(matrix, dtype=np.float32) * self.scales[field][:, None]
+            matrices[field], field_scales = quantize_matrix(matrix, dtype)
+            if field_scales is not None:
+                scales[field] = field_scales
+        return VectorIndex(self.templates, self.template1, self.template2, matrices, ann=self.ann, scales=scales,
+                           deleted=self.deleted, ann_size=self.ann_size, positions=self._positions,
+                           categories=self.categories, keywords=self.keywords, keyword_index=self.keyword_index)
+
+    @property
+    def dim(self) -> int:
+        return self.matrices[FIELDS[0]].shape[1]
+
+    def similarities(self, input_vectors: Dict[str, Any], rows: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+        """
+        返回每个字段下输入向量与全部模板的余弦相似度
+
+        输入为单个向量时结果形状为 (n,)；输入为 (m, dim) 的矩阵时
+        用一次矩阵-矩阵乘法得到 (m, n) 的结果，用于批量查询。
+        指定 rows 时只计算这些行，结果的最后一维与 rows 一一对应。
+        """
+        count = len(self) if rows is None else len(rows)
+        result = {}
+        for field in FIELDS:
+            query = normalize_rows(np.asarray(input_vectors[field], dtype=np.float32))
+            if query.shape[-1] != self.dim:
+                result[field] = np.zeros(query.shape[:-1] + (count,), dtype=np.float32)
+                continue
+            matrix = self.matrices[field]
+            scales = self.scales.get(field)
+            if rows is not None:
+                matrix = matrix[rows]
+                scales = scales[rows] if scales is not None else None
+            result[field] = quantized_dot(query, matrix, scales)
+        return result
+
+    def candidate_rows(self, input_vectors: Dict[str, Any], nprobe: int) -> np.ndarray:
+        """用近似索引取单个查询的候选行：各字段探测到的行取并集"""
+        rows = []
+        for field in FIELDS:
+            query = normalize_rows(np.asarray(input_vectors[field], dtype=np.float32))
+            if query.shape[-1] == self.dim:
+                rows.append(self.ann[field].search(query, nprobe))
+        if not rows:
+            return np.arange(len(self))
+        rows.append(np.arange(self.ann_size, len(self)))
+        return np.unique(np.concatenate(rows))
+
+    def weighted_score(self, similarities: Dict[str, np.ndarray]) -> np.ndarray:
+        """按字段权重加权求和得到向量部分的总分"""
+        total = np.zeros(similarities[FIELDS[0]].shape, dtype=np.float64)
+        for field in FIELDS:
+            total += similarities[field] * FIELD_WEIGHTS[field]
+        return total
+
+    def row_vectors(self, row: int) -> Dict[str, np.ndarray]:
+        """某一行各字段的向量（归一化后的float32）"""
+        vectors = {}
+        for field in FIELDS:
+            vector = np.asarray(self.matrices[field][row], dtype=np.float32)
+            if field in self.scales:
+                vector = vector * self.scales[field][row]
+            vectors[field] = vector
+        return vectors
+
+    def apply_changes(self, changes: Dict[str, Tuple[str, Any]], reset: bool = False) -> "VectorIndex":
+        """
+        返回应用了增量修改的新索引，当前索引不变，正在使用它的查询不受影响
+
+        changes 为 template -> (操作, 数据)：
+            ("upsert", 记录)   追加一行，已有同名模板时旧行标记为删除
+            ("delete", None)   把该模板的行标记为删除
+            ("patch", 字段)    修改 template1/template2/keywords；包含 vectors 时与原向量按字段合并后作为新行追加
+        reset=True 时先删除全部现有行。开销为一次行数大小的掩码、列表拷贝加上追加的行，
+        不拷贝已有的向量矩阵。
+        """
+        count = len(self)
+        positions = {} if reset else dict(self.positions)
+        if reset:
+            deleted = np.ones(count, dtype=bool)
+        elif self.deleted is not None:
+            deleted = self.deleted.copy()
+        else:
+            deleted = np.zeros(count, dtype=bool)
+        template1 = list(self.template1)
+        template2 = list(self.template2)
+        keywords = list(self.keywords)
+        keyword_changes = {}
+        # 分类倒排索引中需要修改的行：row -> 新分类，None 表示删除
+        category_changes = {field: {} for field in CATEGORY_FIELDS}
+        if reset:
+            for field in CATEGORY_FIELDS:
+                category_changes[field] = dict.fromkeys(range(count))
+            keyword_changes = dict.fromkeys(range(count))
+
+        appended = []
+        for template, (kind, data) in changes.items():
+            row = positions.get(template)
+            if kind == "patch":
+                if row is None:
+                    continue
+                row_keywords = dict(keywords[row], **data.get("keywords", {}))
+                if "vectors" not in data:
+                    template1[row] = data.get("template1", template1[row])
+                    template2[row] = data.get("template2", template2[row])
+                    category_changes["template1"][row] = template1[row]
+                    category_changes["template2"][row] = template2[row]
+                    if "keywords" in data:
+                        keywords[row] = row_keywords
+                        keyword_changes[row] = row_keywords
+                    continue
+                vectors = {field: vector.tolist() for field, vector in self.row_vectors(row).items()}
+                vectors.update(data["vectors"])
+                kind, data = "upsert", {
+                    "template1": data.get("template1", template1[row]),
+                    "template2": data.get("template2", template2[row]),
+                    "keywords": row_keywords,
+                    "vectors": vectors
+                }
+            if row is not None:
+                deleted[row] = True
+                del positions[template]
+                for field in CATEGORY_FIELDS:
+                    category_changes[field][row] = None
+                keyword_changes[row] = None
+            if kind == "upsert":
+                positions[template] = count + len(appended)
+                appended.append(dict(data, template=template))
+
+        matrices, scales, storage = self._append_vectors(appended)
+        deleted = np.concatenate([deleted, np.zeros(len(appended), dtype=bool)])
+        template1 += [item.get("template1", "") for item in appended]
+        template2 += [item.get("template2", "") for item in appended]
+        categories = {
+            field: self.categories[field].updated(category_changes[field], values[count:])
+            for field, values in (("template1", template1), ("template2", template2))
+        }
+        keywords += [item.get("keywords") or {} for item in appended]
+        keyword_index = {
+            field: self.keyword_index[field].updated(
+                {row: row_keywords.get(field, []) if row_keywords is not None else None
+                 for row, row_keywords in keyword_changes.items()},
+                [row_keywords.get(field, []) for row_keywords in keywords[count:]],
+                count
+            )
+            for field in FIELDS
+        }
+        return VectorIndex(
+            templates=self.templates + [item["template"] for item in appended],
+            template1=template1,
+            template2=template2,
+            matrices=matrices,
+            ann=self.ann,
+            scales=scales,
+            deleted=deleted if deleted.any() else None,
+            ann_size=self.ann_size,
+            positions=positions,
+            storage=storage,
+            categories=categories,
+            keywords=keywords,
+            keyword_index=keyword_index
+        )
+
+    def _append_vectors(self, records: List[Dict[str, Any]]):
+        """把记录的向量按当前精度追加到缓冲区末尾，返回新的 (matrices, scales, storage)"""
+        count = len(self)
+        if not records:
+            return self.matrices, self.scales, self._storage
+
+        storage = self._storage
+        new_matrices = records_to_matrices(records, dim=self.dim or None)
+        dim = new_matrices[FIELDS[0]].shape[1]
+        if storage["length"] != count or dim != self.dim:
+            # 缓冲区已被更新的索引使用（或原索引还没有向量），在新的缓冲区上追加
+            storage = {"length": count, "matrices": dict(self.matrices), "scales": dict(self.scales)}
+            if dim != self.dim:
+                storage["matrices"] = {field: np.zeros((count, dim), dtype=self.dtype) for field in FIELDS}
+
+        matrices = {}
+        scales = {}
+        for field in FIELDS:
+            rows, row_scales = quantize_matrix(new_matrices[field], self.dtype)
+            storage["matrices"][field] = append_rows(storage["matrices"][field], count, rows)
+            matrices[field] = storage["matrices"][field][:count + len(records)]
+            if row_scales is not None:
+                field_scales = storage["scales"].get(field, np.ones(count, dtype=np.float32))
+                storage["scales"][field] = append_rows(field_scales, count, row_scales)
+                scales[field] = storage["scales"][field][:count + len(records)]
+        storage["length"] = count + len(records)
+        return matrices, scales, storage
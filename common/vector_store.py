@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple
+
+from common import config
+from common.vector_index import FIELDS, records_to_matrices
+from common.ann_index import IVFIndex
+
+META_FILE = "meta.json"
+STORE_VERSION = 1
+SUPPORTED_DTYPES = ("float32", "float16")
+
+
+def content_hash(template: str, parts: Dict[str, str], model_id: str = config.EMBEDDING_MODEL_ID) -> str:
+    """模板名 + 四个部分文本 + 模型标识的哈希，相同则向量无需重新计算"""
+    payload = json.dumps([model_id, template] + [parts.get(field, "") for field in FIELDS], ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def record_hash(item: Dict[str, Any]) -> str:
+    """已有记录的内容哈希，旧数据没有 content_hash 字段时按 parts 重新计算"""
+    return item.get("content_hash") or content_hash(item.get("template", ""), item.get("parts", {}))
+
+
+def is_columnar_store(path: str) -> bool:
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, META_FILE))
+
+
+def records_to_columns(records: List[Dict[str, Any]], dtype: str = "float32") -> Tuple[List[Dict[str, Any]], Dict[str, np.ndarray]]:
+    """把JSON记录拆成元数据表和每个字段一个归一化后的连续矩阵"""
+    matrices = {field: matrix.astype(dtype) for field, matrix in records_to_matrices(records).items()}
+    meta_records = [{key: value for key, value in item.items() if key != "vectors"} for item in records]
+    return meta_records, matrices
+
+
+def ann_file(path: str, field: str) -> str:
+    return os.path.join(path, f"ivf_{field}.npz")
+
+
+def save_ann(path: str, matrices: Dict[str, np.ndarray], n_lists: Optional[int] = None):
+    """为每个字段构建IVF近似索引并保存到存储目录"""
+    for field in FIELDS:
+        matrix = np.asarray(matrices[field], dtype=np.float32)
+        IVFIndex.build(matrix, n_lists=n_lists).save(ann_file(path, field))
+
+
+def load_ann(path: str) -> Optional[Dict[str, IVFIndex]]:
+    """读取IVF近似索引，任一字段缺失时返回None（退回全量计算）"""
+    if not all(os.path.exists(ann_file(path, field)) for field in FIELDS):
+        return None
+    return {field: IVFIndex.load(ann_file(path, field)) for field in FIELDS}
+
+
+def columnar_options(path: str) -> Tuple[str, bool]:
+    """已有列式存储的向量精度和是否带近似索引，存储不存在时为 (float32, False)"""
+    if not is_columnar_store(path):
+        return "float32", False
+    with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+        dtype = json.load(f).get("dtype", "float32")
+    return dtype, all(os.path.exists(ann_file(path, field)) for field in FIELDS)
+
+
+def save_columnar(records: List[Dict[str, Any]], path: str, dtype: str = "float32",
+                  ann: bool = False, ann_lists: Optional[int] = None):
+    """
+    保存为列式二进制格式：
+        path/text1.npy .. text4.npy  每个字段一个 (n, dim) 的归一化矩阵
+        path/meta.json               template/template1/template2/parts 等元数据
+        path/ivf_text1.npz ..        ann=True 时每个字段的IVF近似索引
+    先写入临时目录再整体替换，读取方不会看到写了一半的数据。
+    """
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"不支持的数据类型: {dtype}")
+
+    meta_records, matrices = records_to_columns(records, dtype=dtype)
+    path = os.path.abspath(path)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    old_path = f"{path}.old-{os.getpid()}"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    for field, matrix in matrices.items():
+        np.save(os.path.join(tmp_path, f"{field}.npy"), matrix)
+    if ann and records:
+        save_ann(tmp_path, matrices, n_lists=ann_lists)
+
+    meta = {
+        "version": STORE_VERSION,
+        "count": len(records),
+        "dim": matrices[FIELDS[0]].shape[1],
+        "dtype": dtype,
+        "normalized": True,
+        "records": meta_records
+    }
+    with open(os.path.join(tmp_path, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    if os.path.exists(path):
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    if os.path.exists(old_path):
+        shutil.rmtree(old_path)
+
+
+def load_columnar(path: str, mmap: bool = True) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+    """读取列式存储，mmap=True 时矩阵以只读内存映射方式打开"""
+    with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    mmap_mode = "r" if mmap else None
+    matrices = {field: np.load(os.path.join(path, f"{field}.npy"), mmap_mode=mmap_mode) for field in FIELDS}
+    return meta, matrices
+
+
+def load_records(path: str) -> List[Dict[str, Any]]:
+    """把列式存储还原成与 vector_new.json 相同结构的记录列表（向量为归一化后的值）"""
+    meta, matrices = load_columnar(path, mmap=False)
+    records = []
+    for row, item in enumerate(meta["records"]):
+        record = dict(item)
+        record["vectors"] = {field: matrices[field][row].astype(np.float32).tolist() for field in FIELDS}
+        records.append(record)
+    return records
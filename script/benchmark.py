@@ -0,0 +1,317 @@
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import platform
+import subprocess
+import multiprocessing
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.vector_index import FIELDS
+from common.vector_store import META_FILE, STORE_VERSION, is_columnar_store, save_ann
+from common.text2vector_stub import LATENCY_DISTRIBUTIONS
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 每次写入矩阵的行数，控制生成大规模数据时的内存
+GENERATE_CHUNK_ROWS = 50000
+# 查询文本用到的词，每条查询随机组合，加上序号保证不命中向量缓存
+QUERY_WORDS = ["货物", "买卖", "租赁", "房屋", "服务", "技术", "委托", "运输", "仓储", "保险",
+               "借款", "担保", "建设", "工程", "采购", "供用", "电力", "劳动", "咨询", "加工"]
+
+
+def category_names(i):
+    """合成数据第i行的一级、二级分类（分类匹配只比较汉字，名称中不能带数字）"""
+    first = QUERY_WORDS[i % len(QUERY_WORDS)]
+    second = QUERY_WORDS[i // len(QUERY_WORDS) % len(QUERY_WORDS)]
+    return f"{first}合同", f"{first}{second}合同"
+
+
+def rss_mb(field="VmRSS"):
+    """当前进程的常驻内存（VmRSS）或峰值（VmHWM），单位MB"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def generate_store(path, size, dim, ann=False, seed=0):
+    """
+    生成合成的列式向量存储（与 convert_vector_store.py 的输出格式相同）
+
+    向量为若干簇中心加噪声后归一化，近似真实数据的聚簇结构；矩阵分块写入内存映射文件，
+    生成百万级数据时不需要把整个矩阵放在内存中。同样规模和维度的存储已存在时直接复用。
+    """
+    if is_columnar_store(path):
+        with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("count") == size and meta.get("dim") == dim and (not ann or os.path.exists(os.path.join(path, "ivf_text1.npz"))):
+            print(f"复用已有的合成存储 {path}")
+            return
+    rng = np.random.default_rng(seed)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    os.makedirs(tmp_path)
+    start = time.perf_counter()
+
+    clusters = max(16, int(np.sqrt(size)))
+    matrices = {}
+    for field in FIELDS:
+        centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+        matrix = np.lib.format.open_memmap(os.path.join(tmp_path, f"{field}.npy"), mode="w+", dtype=np.float32, shape=(size, dim))
+        for begin in range(0, size, GENERATE_CHUNK_ROWS):
+            end = min(size, begin + GENERATE_CHUNK_ROWS)
+            rows = centers[rng.integers(clusters, size=end - begin)] + rng.standard_normal((end - begin, dim)).astype(np.float32)
+            matrix[begin:end] = rows / np.linalg.norm(rows, axis=1, keepdims=True)
+        matrix.flush()
+        matrices[field] = matrix
+    if ann:
+        save_ann(tmp_path, matrices)
+
+    records = []
+    for i in range(size):
+        template1, template2 = category_names(i)
+        records.append({"template": f"合成模板{i}", "template1": template1, "template2": template2})
+    meta = {"version": STORE_VERSION, "count": size, "dim": dim, "dtype": "float32", "normalized": True, "records": records}
+    with open(os.path.join(tmp_path, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    del matrices
+
+    if os.path.exists(path):
+        import shutil
+        shutil.rmtree(path)
+    os.rename(tmp_path, path)
+    print(f"已生成 {size} 条、{dim} 维的合成存储 {path}，耗时 {time.perf_counter() - start:.1f}s")
+
+def query_payload(i, rng, top_k):
+    words = rng.choice(QUERY_WORDS, size=(4, 3))
+    payload = {f"text{j + 1}": "".join(words[j]) + f"{i}-{j}" for j in range(4)}
+    template1, template2 = category_names(int(rng.integers(len(QUERY_WORDS) ** 2)))
+    payload.update(template1=template1, template2=template2, top_k=top_k)
+    return payload
+
+def latency_stats(latencies, wall, queries, errors):
+    latencies = np.asarray(latencies) * 1000
+    stats = {
+        "requests": int(len(latencies)),
+        "errors": errors,
+        "wall_seconds": round(wall, 4),
+        "throughput_qps": round(queries / wall, 2) if wall > 0 else None
+    }
+    if len(latencies):
+        stats.update({
+            "mean_ms": round(float(latencies.mean()), 3),
+            "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+            "max_ms": round(float(latencies.max()), 3)
+        })
+    return stats
+
+async def run_load(client, url, payloads, concurrency, queries_per_request=1):
+    """concurrency 个协程依次取出请求发送，记录每个请求的耗时"""
+    latencies = []
+    errors = 0
+    pending = iter(payloads)
+
+    async def worker():
+        nonlocal errors
+        for payload in pending:
+            start = time.perf_counter()
+            response = await client.post(url, json=payload)
+            if response.status_code != 200:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    return latency_stats(latencies, wall, len(latencies) * queries_per_request, errors)
+
+def run_stub(port, args):
+    import uvicorn
+    from common.text2vector_stub import create_app
+    app = create_app(
+        dim=args.dim,
+        latency=args.embedding_latency,
+        latency_dist=args.embedding_latency_dist,
+        latency_jitter=args.embedding_latency_jitter,
+        error_rate=args.embedding_error_rate,
+        max_concurrency=args.embedding_max_concurrency,
+        seed=args.seed
+    )
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_for_port(port, timeout=30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"向量服务替身未能在 {timeout}s 内启动")
+
+async def benchmark_store(args):
+    """在当前进程中加载服务（读取环境变量中的存储路径），依次压测单条和批量查询"""
+    import httpx
+    sys.path.append(os.path.join(ROOT_DIR, "api"))
+    rss_before = rss_mb()
+    import api_new
+
+    rng = np.random.default_rng(args.seed)
+    result = {"rss_mb_before_load": round(rss_before, 1)}
+    transport = httpx.ASGITransport(app=api_new.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        start = time.perf_counter()
+        async with api_new.lifespan(api_new.app):
+            result["load_seconds"] = round(time.perf_counter() - start, 3)
+            result["rss_mb_after_load"] = round(rss_mb(), 1)
+
+            warmup = [query_payload(-i - 1, rng, args.top_k) for i in range(args.warmup)]
+            await run_load(client, "/find_similar_templates/", warmup, args.concurrency)
+
+            single = [query_payload(i, rng, args.top_k) for i in range(args.queries)]
+            result["single"] = await run_load(client, "/find_similar_templates/", single, args.concurrency)
+            result["single"]["concurrency"] = args.concurrency
+
+            batches = [
+                [query_payload(args.queries + b * args.batch_size + i, rng, args.top_k) for i in range(args.batch_size)]
+                for b in range(max(1, args.queries // args.batch_size))
+            ]
+            result["batch"] = await run_load(client, "/find_similar_templates/batch", batches, args.concurrency,
+                                             queries_per_request=args.batch_size)
+            result["batch"].update(concurrency=args.concurrency, batch_size=args.batch_size)
+    result["rss_mb_peak"] = round(rss_mb("VmHWM"), 1)
+    return result
+
+def run_one(args):
+    """子进程：按环境变量中的配置导入服务并压测，结果写入 --result-file"""
+    result = asyncio.run(benchmark_store(args))
+    with open(args.result_file, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+
+def child_env(args, store_path, port):
+    """服务在导入时读取配置，通过子进程的环境变量指定存储路径和向量服务地址"""
+    env = dict(os.environ)
+    env.update({
+        "VECTOR_STORE_PATH": store_path,
+        "VECTOR_FILE_PATH": os.path.join(store_path, "missing.json"),
+        "LEXICAL_INDEX_PATH": os.path.join(store_path, "missing.npz"),
+        "TEXT2VECTOR_URL": f"http://127.0.0.1:{port}/text2vector/",
+        "TEXT2VECTOR_BATCH_URL": f"http://127.0.0.1:{port}/text2vector/batch/" if args.embedding_batch else "",
+        "VECTOR_DTYPE": args.dtype,
+        "ANN_NPROBE": str(args.nprobe if args.ann else 0)
+    })
+    return env
+
+def print_result(result):
+    line = f"{result['size']:>9} 条  加载 {result['load_seconds']:.2f}s  内存 {result['rss_mb_after_load']:.0f}MB"
+    for name, label in (("single", "单条"), ("batch", "批量")):
+        stats = result[name]
+        if "p50_ms" not in stats:
+            line += f"  {label} 全部 {stats['errors']} 个请求失败"
+            continue
+        line += (f"  {label} p50/p95/p99 {stats['p50_ms']:.1f}/{stats['p95_ms']:.1f}/{stats['p99_ms']:.1f}ms "
+                 f"{stats['throughput_qps']:.1f}qps")
+        if stats["errors"]:
+            line += f" 失败 {stats['errors']}"
+    print(line)
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def child_args(args, store_path, result_file):
+    """把压测参数原样传给子进程"""
+    argv = [sys.executable, os.path.abspath(__file__), "--run-store", store_path, "--result-file", result_file]
+    for name in ("queries", "warmup", "concurrency", "batch_size", "top_k", "seed"):
+        argv += [f"--{name.replace('_', '-')}", str(getattr(args, name))]
+    return argv
+
+def main():
+    parser = argparse.ArgumentParser(description="用合成向量存储压测模板匹配服务，输出各规模下的延迟分位数、吞吐和内存")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000], help="合成存储的模板数量")
+    parser.add_argument("--dim", type=int, default=768, help="向量维度")
+    parser.add_argument("--dtype", default="float32", help="服务内存中向量的精度（float32/float16/int8）")
+    parser.add_argument("--ann", action="store_true", help="生成并使用IVF近似索引")
+    parser.add_argument("--nprobe", type=int, default=8, help="使用近似索引时每个字段探测的簇数")
+    parser.add_argument("--queries", type=int, default=200, help="单条查询的请求数，批量查询共查询同样多条")
+    parser.add_argument("--warmup", type=int, default=10, help="正式计时前的预热请求数")
+    parser.add_argument("--concurrency", type=int, default=8, help="同时进行的请求数")
+    parser.add_argument("--batch-size", type=int, default=20, help="批量查询每次请求的查询条数")
+    parser.add_argument("--top-k", type=int, default=3, help="每条查询返回的模板数")
+    parser.add_argument("--embedding-latency", type=float, default=0.02, help="向量服务替身每次请求的延迟（秒）")
+    parser.add_argument("--embedding-latency-dist", default="fixed", choices=LATENCY_DISTRIBUTIONS, help="向量服务替身的延迟分布")
+    parser.add_argument("--embedding-latency-jitter", type=float, default=0.0, help="延迟离散程度（见 text2vector_stub_server.py）")
+    parser.add_argument("--embedding-error-rate", type=float, default=0.0, help="向量服务替身返回错误的概率")
+    parser.add_argument("--embedding-max-concurrency", type=int, default=0, help="向量服务替身同时处理的请求上限，0 为不限")
+    parser.add_argument("--embedding-batch", action="store_true", help="服务使用向量替身的批量接口")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--work-dir", default="/tmp/contract_template_benchmark", help="合成存储目录，相同规模和维度时复用")
+    parser.add_argument("--output", default="benchmark.json", help="结果JSON文件")
+    parser.add_argument("--run-store", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_store:
+        run_one(args)
+        return
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    # 向量服务替身在单独的进程中运行，不与被测服务争用CPU
+    port = free_port()
+    stub = multiprocessing.Process(target=run_stub, args=(port, args), daemon=True)
+    stub.start()
+    results = []
+    try:
+        wait_for_port(port)
+        for size in args.sizes:
+            store_path = os.path.join(args.work_dir, f"store_{size}_{args.dim}")
+            generate_store(store_path, size, args.dim, ann=args.ann, seed=args.seed)
+            result_file = os.path.join(args.work_dir, f"result_{size}_{args.dim}.json")
+            # 每个规模在独立的子进程中加载，内存统计互不影响
+            subprocess.run(child_args(args, store_path, result_file), env=child_env(args, store_path, port), check=True)
+            with open(result_file, "r", encoding="utf-8") as f:
+                results.append(dict(size=size, **json.load(f)))
+            print_result(results[-1])
+    finally:
+        stub.terminate()
+        stub.join()
+
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {key: value for key, value in vars(args).items() if key not in ("run_store", "result_file")}
+        },
+        "results": results
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存至 {args.output}")
+
+if __name__ == "__main__":
+    main()
+    """
+    python /home/user/opt/ssy/contract_template/script/benchmark.py --sizes 1000 10000 100000 --dim 768 --output benchmark.json
+    """
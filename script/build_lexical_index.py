@@ -0,0 +1,50 @@
+import os
+import sys
+import time
+import argparse
+import json
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import config
+from common.fulltext_store import FulltextStore
+from common.lexical_index import BM25Index, template_documents
+from common.segment_log import replay_records
+from common.vector_store import META_FILE, is_columnar_store
+
+
+def load_parts(path):
+    """读取模板名和四个部分文本；列式存储只读 meta.json，不加载向量"""
+    if is_columnar_store(path):
+        with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)["records"]
+    return replay_records(path, vectors=False)
+
+def main():
+    parser = argparse.ArgumentParser(description="为模板全文和四个部分构建BM25倒排索引，用于混合检索")
+    parser.add_argument("--store", default=config.VECTOR_FILE_PATH, help="向量JSON文件或列式存储目录")
+    parser.add_argument("--fulltext-path", default=config.FULLTEXT_PATH, help="全文存储sqlite文件路径（由 update_contract.py 生成）")
+    parser.add_argument("--output", default=config.LEXICAL_INDEX_PATH, help="输出索引文件路径")
+    args = parser.parse_args()
+
+    records = load_parts(args.store)
+    fulltexts = {}
+    if os.path.exists(args.fulltext_path):
+        store = FulltextStore(args.fulltext_path)
+        fulltexts = store.items()
+        store.close()
+    else:
+        print(f"警告：全文存储 {args.fulltext_path} 不存在，只索引四个部分")
+
+    start = time.perf_counter()
+    index = BM25Index.build(template_documents(records, fulltexts))
+    index.save(args.output)
+    with_fulltext = sum(1 for item in records if fulltexts.get(item.get("template")) or item.get("fulltext"))
+    print(f"已为 {len(index)} 个模板（其中 {with_fulltext} 个有全文）构建BM25索引，"
+          f"词表 {len(index.terms)} 个词，倒排表 {index.nbytes / 1024 / 1024:.1f}MB，"
+          f"文件 {os.path.getsize(args.output) / 1024 / 1024:.1f}MB，耗时 {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
+    """
+    python /home/user/opt/ssy/contract_template/script/build_lexical_index.py --store /home/user/opt/ssy/contract_template/data/vector_data/vector_new.json
+    """
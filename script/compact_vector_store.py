@@ -0,0 +1,27 @@
+import os
+import sys
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import config
+from common.segment_log import compact, list_segments
+from common.vector_store import SUPPORTED_DTYPES
+
+
+def main():
+    parser = argparse.ArgumentParser(description="把入库时写入的追加段合并进向量JSON文件（可同时生成列式存储）")
+    parser.add_argument("--output", default=config.VECTOR_FILE_PATH, help="向量JSON文件路径")
+    parser.add_argument("--columnar-output", default=None, help="同时生成的列式向量存储目录，默认在合并服务读取的数据文件时重建服务使用的列式存储")
+    parser.add_argument("--dtype", default=None, choices=SUPPORTED_DTYPES, help="列式存储的向量精度，默认沿用已有存储（新建时为 float32）")
+    parser.add_argument("--ann", action="store_true", default=None, help="同时构建IVF近似最近邻索引，默认已有存储带近似索引时重建")
+    parser.add_argument("--no-ann", dest="ann", action="store_false", help="不构建IVF近似最近邻索引")
+    args = parser.parse_args()
+
+    print(f"待合并的段: {len(list_segments(args.output))} 个")
+    compact(args.output, columnar_path=args.columnar_output, dtype=args.dtype, ann=args.ann)
+
+if __name__ == "__main__":
+    main()
+    """
+    python /home/user/opt/ssy/contract_template/script/compact_vector_store.py --output /home/user/opt/ssy/contract_template/data/vector_data/vector_new.json --columnar-output /home/user/opt/ssy/contract_template/data/vector_data/vector_new
+    """
@@ -0,0 +1,37 @@
+import os
+import sys
+import json
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import config
+from common.vector_store import save_columnar, SUPPORTED_DTYPES
+
+
+def get_dir_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+def main():
+    parser = argparse.ArgumentParser(description="将 vector_new.json 转换为列式二进制向量存储")
+    parser.add_argument("--input", default=config.VECTOR_FILE_PATH, help="输入JSON文件路径")
+    parser.add_argument("--output", default=config.VECTOR_STORE_PATH, help="输出目录路径")
+    parser.add_argument("--dtype", default="float32", choices=SUPPORTED_DTYPES, help="向量存储精度")
+    parser.add_argument("--ann", action="store_true", help="同时构建IVF近似最近邻索引")
+    parser.add_argument("--ann-lists", type=int, default=None, help="IVF每个字段的簇数，默认取 sqrt(模板数)")
+    args = parser.parse_args()
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        records = json.load(f)
+    print(f"成功读取 {len(records)} 条记录")
+
+    save_columnar(records, args.output, dtype=args.dtype, ann=args.ann, ann_lists=args.ann_lists)
+
+    input_size = os.path.getsize(args.input)
+    output_size = get_dir_size(args.output)
+    print(f"已保存至 {args.output}，大小 {input_size / 1024 / 1024:.1f}MB -> {output_size / 1024 / 1024:.1f}MB")
+
+if __name__ == "__main__":
+    main()
+    """
+    python /home/user/opt/ssy/contract_template/script/convert_vector_store.py --input /home/user/opt/ssy/contract_template/data/vector_data/vector_new.json --output /home/user/opt/ssy/contract_template/data/vector_data/vector_new
+    """
@@ -1,23 +1,45 @@
-import json
 import os
-
-template_to_delete = "港口作业合同_919325807132807168"
-
-file_path = "/home/user/opt/ssy/contract_template/vector_new.json"
-
-with open(file_path, "r", encoding="utf-8") as f:
-    data = json.load(f)
-
-original_count = len(data)
-
-filtered_data = [item for item in data if item.get("template") != template_to_delete]
-
-new_count = len(filtered_data)
-deleted_count = original_count - new_count
-
-print(f"原始数据总数：{original_count}")
-print(f"删除后的数据总数：{new_count}")
-print(f"删除了 {deleted_count} 条数据")
-
-with open(file_path, "w", encoding="utf-8") as f:
-    json.dump(filtered_data, f, ensure_ascii=False, indent=2)
\ No newline at end of file
+import sys
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import config
+from common.template_store import TemplateStore, read_csv_column
+
+
+def main():
+    parser = argparse.ArgumentParser(description="从向量数据中删除模板")
+    parser.add_argument("--template", nargs="*", default=[], help="要删除的模板名称，如 港口作业合同_919325807132807168")
+    parser.add_argument("--csv", default=None, help="从CSV读取要删除的模板名称（跳过表头）")
+    parser.add_argument("--key-column", type=int, default=1, help="CSV中模板名称列索引（从0开始）")
+    parser.add_argument("--store", default=config.VECTOR_FILE_PATH, help="向量JSON文件路径")
+    parser.add_argument("--compact", action="store_true", help="删除后立即合并进JSON文件，否则只写入追加段")
+    parser.add_argument("--columnar-output", default=None, help="合并时同时生成的列式向量存储目录，默认在合并服务读取的数据文件时重建服务使用的列式存储")
+    args = parser.parse_args()
+
+    templates = list(args.template)
+    if args.csv:
+        templates.extend(read_csv_column(args.csv, args.key_column)[0])
+    if not templates:
+        parser.error("需要通过 --template 或 --csv 指定要删除的模板")
+
+    store = TemplateStore(args.store)
+    original_count = len(store)
+    not_found = store.delete_many(dict.fromkeys(templates))
+
+    print(f"原始数据总数：{original_count}")
+    print(f"删除后的数据总数：{len(store)}")
+    print(f"删除了 {original_count - len(store)} 条数据")
+    if not_found:
+        print(f"有 {len(not_found)} 个模板不存在: {', '.join(not_found[:10])}")
+
+    if args.compact:
+        store.compact(columnar_path=args.columnar_output)
+    else:
+        store.commit()
+
+if __name__ == "__main__":
+    main()
+    """
+    python /home/user/opt/ssy/contract_template/script/delete_data.py --template 港口作业合同_919325807132807168
+    """
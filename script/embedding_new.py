@@ -1,31 +1,48 @@
+import asyncio
 import csv
 import os
-import json
-import requests
-import time
+import sys
 import argparse
 from tqdm import tqdm
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import config
+from common.csv_stream import CSVStream
+from common.embedding_cache import EmbeddingCache
+from common.embedding_client import EmbeddingClient
+from common.rate_limit import TokenBucket
+from common.vector_store import content_hash, record_hash
+from common.segment_log import RESET_OP, append_segment, upsert_ops, replay_records, compact
+from common.vector_index import FIELDS
 
-def get_vector(text, api_url="http://192.168.10.58:8101/text2vector/"):
-    headers = {"Content-Type": "application/json"}
-    data = {"text": text}
-    try:
-        response = requests.post(api_url, headers=headers, json=data)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"请求失败，状态码: {response.status_code}")
-            return None
-    except Exception as e:
-        print(f"请求异常: {e}")
-        return None
-
-def process_csv(csv_file, output_file, template_column=0, template1_column=1, template2_column=2, 
-                text1_column=3, text2_column=4, text3_column=5, text4_column=6, 
-                batch_size=100, sleep_time=0.1, encoding='utf-8', first_save_append=False):
+
+def row_vectors(text_parts, vectors_by_text):
+    """
+    从批量结果中取出一行四个部分的向量
+
+    返回 (vectors, error)，任一部分为空或重试后仍失败时 vectors 为 None。
+    """
+    vectors = {}
+    for part_name, part_text in text_parts.items():
+        if not part_text:
+            return None, f"部分 {part_name} 为空"
+        vector = vectors_by_text[part_text]
+        if isinstance(vector, Exception):
+            return None, f"无法获取部分 {part_name} 的向量: {vector}"
+        vectors[part_name] = vector
+    return vectors, None
+
+def split_keywords(text):
+    """拆分以 | 分隔的关键词列，去掉空白和重复的关键词，保持原有顺序"""
+    return list(dict.fromkeys(keyword.strip() for keyword in text.split("|") if keyword.strip()))
+
+async def process_csv_async(csv_file, output_file, template_column=0, template1_column=1, template2_column=2,
+                            text1_column=3, text2_column=4, text3_column=5, text4_column=6, keyword_columns=None,
+                            batch_size=100, concurrency=8, rate=20.0, retries=3,
+                            first_save_append=False, cache=None, incremental=False,
+                            compact_output=True, columnar_output=None):
     """
-        csv_file: 输入CSV文件路径
+        csv_file: 输入CSV文件路径，可以是多个文件的列表，"-" 表示标准输入
         output_file: 输出JSON文件路径
         template_column: 模板名称列索引（从0开始）
         template1_column: 一级分类列索引
@@ -34,134 +51,154 @@ def process_csv(csv_file, output_file, template_column=0, template1_column=1, te
         text2_column: 文本2列索引
         text3_column: 文本3列索引
         text4_column: 文本4列索引
-        batch_size: 批处理大小，每处理这么多条记录保存一次
-        sleep_time: 每次请求后的休眠时间（秒）
+        keyword_columns: 与 text1..text4 对应的四个关键词列索引（以 | 分隔），为空时不读取关键词
+        batch_size: 批处理大小，每处理这么多条记录保存一次；同一批内的文本一起请求向量
+        concurrency: 同时发往向量服务的最大请求数
+        rate: 每秒最多HTTP请求数（令牌桶限流），<=0 表示不限流
+        retries: 单个请求失败后的重试次数（指数退避）
+        incremental: 增量模式，跳过输出文件中内容哈希相同的行
+        compact_output: 结束后把本次写入的段合并进 output_file
+        columnar_output: 合并时同时生成的列式存储目录
+    CSV只顺序读取一遍（多个文件依次读取，每个文件跳过表头），进度按已读取的字节数显示。
+    失败的行不会丢弃，而是连同原始列写入 output_file + ".failed.csv"，便于重新处理。
+
+    每条记录带有 content_hash（模板名 + 四个部分文本 + 模型标识）。增量模式下
+    内容未变的行直接跳过，只有分类或关键词变化的行只更新这些字段不重新请求向量，
+    内容变化的行重新获取向量并按模板名覆盖旧记录。每批处理完即写入追加段，
+    中途崩溃后需以增量模式（--incremental）重新运行才能从中断处继续：已写入的行
+    会因哈希相同被跳过。不加 --incremental 重新运行时会先写入 reset，全部行重新获取向量。
     """
-    results = []
+    client = EmbeddingClient(
+        max_connections=concurrency,
+        max_concurrency=concurrency,
+        cache=cache,
+        retries=retries,
+        rate_limiter=TokenBucket(rate)
+    )
+    failed_file = output_file + ".failed.csv"
+    max_col = max(template_column, template1_column, template2_column,
+                  text1_column, text2_column, text3_column, text4_column, *(keyword_columns or []))
     count = 0
-    
-    with open(csv_file, 'r', encoding='utf-8-sig') as f:
-        reader = csv.reader(f)
-        next(reader, None)
-        f.seek(0)
-        total_rows = sum(1 for _ in reader) - 1
-        f.seek(0)
-        reader = csv.reader(f)
-        next(reader, None)
-
-        for row in tqdm(reader, total=total_rows, desc="处理数据"):
-            max_col = max(template_column, template1_column, template2_column, 
-                          text1_column, text2_column, text3_column, text4_column)
+    saved = 0
+    skipped = 0
+    failed_rows = []
+    metadata_updates = []
+
+    existing = {}
+    if incremental:
+        # 包括上次中断时已写入但尚未合并的段
+        existing = {item.get("template"): item for item in replay_records(output_file)}
+        print(f"增量模式：输出文件中已有 {len(existing)} 条记录")
+
+    def row_parts(row):
+        return {
+            "text1": row[text1_column],
+            "text2": row[text2_column],
+            "text3": row[text3_column],
+            "text4": row[text4_column]
+        }
+
+    def row_keywords(row):
+        return {field: split_keywords(row[column]) for field, column in zip(FIELDS, keyword_columns)}
+
+    def row_metadata(row):
+        """不参与内容哈希的字段，变化时不需要重新获取向量"""
+        metadata = {"template1": row[template1_column], "template2": row[template2_column]}
+        if keyword_columns:
+            metadata["keywords"] = row_keywords(row)
+        return metadata
+
+    async def flush(batch):
+        nonlocal saved
+        # 整批文本一次交给客户端：支持批量接口时按批请求，否则并发逐条请求
+        texts = [text for row in batch for text in row_parts(row).values() if text]
+        vectors_by_text = dict(zip(texts, await client.get_vectors(texts, return_exceptions=True)))
+
+        results = []
+        for row in batch:
+            text_parts = row_parts(row)
+            vectors, error = row_vectors(text_parts, vectors_by_text)
+            if vectors is None:
+                print(f"警告: 模板 {row[template_column]} 处理失败，{error}")
+                failed_rows.append(row)
+                continue
+            results.append({
+                "template": row[template_column],
+                **row_metadata(row),
+                "parts": text_parts,
+                "content_hash": content_hash(row[template_column], text_parts),
+                "vectors": vectors
+            })
+        if results:
+            save_results(results, output_file, append=(saved > 0 or first_save_append or incremental))
+            saved += len(results)
+
+    stream = CSVStream(csv_file)
+    progress = tqdm(total=stream.total_bytes, desc="处理数据", unit="B", unit_scale=True)
+    batch = []
+    try:
+        for row in stream:
+            progress.update(stream.bytes_read - progress.n)
             if len(row) <= max_col:
                 print(f"警告: 行 {count+1} 列数不足，跳过")
                 continue
-                
-            template = row[template_column]
-            template1 = row[template1_column]
-            template2 = row[template2_column]
-            text1 = row[text1_column]
-            text2 = row[text2_column]
-            text3 = row[text3_column]
-            text4 = row[text4_column]
-            
-            vectors = {}
-            all_vectors_valid = True
-            
-            text_parts = {
-                "text1": text1,
-                "text2": text2,
-                "text3": text3,
-                "text4": text4
-            }
-            
-            parts = {}
-            
-            for part_name, part_text in text_parts.items():
-                parts[part_name] = part_text
-                if part_text:
-                    vector_result = get_vector(part_text)
-                    if vector_result and "result" in vector_result:
-                        vectors[part_name] = vector_result["result"]
-                    else:
-                        all_vectors_valid = False
-                        print(f"警告: 无法获取部分 {part_name} 的向量")
-                    time.sleep(sleep_time)
-                else:
-                    all_vectors_valid = False
-                    print(f"警告: 部分 {part_name} 为空")
-            
-            if all_vectors_valid and vectors:
-                result = {
-                    "template": template,
-                    "template1": template1,
-                    "template2": template2,
-                    "parts": parts,
-                    "vectors": vectors
-                }
-                results.append(result)
-            
             count += 1
-            
-            if count % batch_size == 0:
-            # 第一次保存时，如果指定了first_save_append，则使用追加模式
-                save_results(results, output_file, append=(count > batch_size or first_save_append))
+            old_item = existing.get(row[template_column])
+            if old_item is not None and record_hash(old_item) == content_hash(row[template_column], row_parts(row)):
+                skipped += 1
+                metadata = row_metadata(row)
+                if any(old_item.get(key) != value for key, value in metadata.items()):
+                    metadata_updates.append(dict(old_item, **metadata))
+                continue
+            batch.append(row)
+            if len(batch) >= batch_size:
+                await flush(batch)
                 print(f"已处理 {count} 条记录，保存中间结果")
-                results = []
+                batch = []
+        if batch:
+            await flush(batch)
+        progress.update(stream.bytes_read - progress.n)
+        if metadata_updates:
+            save_results(metadata_updates, output_file, append=True)
+            print(f"有 {len(metadata_updates)} 条记录仅分类或关键词变化，已更新这些字段")
+    finally:
+        progress.close()
+        await client.close()
 
-            time.sleep(sleep_time)
-    
-    if results:
-        save_results(results, output_file, append=(count > batch_size or first_save_append))
-    
-    print(f"处理完成，共处理 {count} 条记录，结果保存至 {output_file}")
+    if failed_rows:
+        with open(failed_file, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f)
+            if stream.header:
+                writer.writerow(stream.header)
+            writer.writerows(failed_rows)
+        print(f"有 {len(failed_rows)} 条记录处理失败，已写入 {failed_file}")
+
+    if compact_output:
+        compact(output_file, columnar_path=columnar_output)
+
+    print(f"处理完成，共处理 {count} 条记录，成功 {saved} 条，未变化跳过 {skipped} 条，结果保存至 {output_file}")
+    if cache is not None:
+        print(f"向量缓存统计: {cache.stats()}")
+
+def process_csv(csv_file, output_file, **kwargs):
+    asyncio.run(process_csv_async(csv_file, output_file, **kwargs))
 
 def save_results(results, output_file, append=False):
+    """
+    把一批结果写成一个追加段，每批只写一次，不再读取和重写整个输出文件。
+    覆盖模式（append=False）时段首写入 reset，合并时丢弃之前的数据。
+    运行结束后由 compact() 合并为服务使用的 JSON 文件。
+    """
+    ops = upsert_ops(results)
     if not append:
         print(f"使用覆盖模式保存 {len(results)} 条记录")
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
-    else:
-        try:
-            existing_data = []
-            try:
-                with open(output_file, 'r', encoding='utf-8') as f:
-                    existing_data = json.load(f)
-                print(f"成功读取现有数据，共 {len(existing_data)} 条记录")
-            except FileNotFoundError:
-                print(f"文件 {output_file} 不存在，将创建新文件")
-            
-            original_count = len(existing_data)
-            existing_data.extend(results)
-            print(f"追加 {len(results)} 条记录后，共 {len(existing_data)} 条记录")
-            
-            # 备份原文件
-            if original_count > 0:
-                import shutil
-                backup_file = "/home/user/opt/ssy/contract_template/data/backup/vector_new.json" + ".backup." + time.strftime("%Y%m%d%H%M%S")
-                shutil.copy2(output_file, backup_file)
-                print(f"已将原文件备份到 {backup_file}")
-            
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(existing_data, f, ensure_ascii=False, indent=2)
-        except json.JSONDecodeError as e:
-            print(f"JSON解析错误: {e}，将备份原文件并只保存新数据")
-            # 备份原文件
-            import shutil
-            backup_file = output_file + ".backup." + time.strftime("%Y%m%d%H%M%S")
-            try:
-                shutil.copy2(output_file, backup_file)
-                print(f"已将原文件备份到 {backup_file}")
-            except Exception as be:
-                print(f"备份文件失败: {be}")
-            
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(results, f, ensure_ascii=False, indent=2)
-            print(f"警告：由于JSON解析错误，原有数据可能丢失，只保存了新的 {len(results)} 条记录")
+        ops = [RESET_OP] + ops
+    append_segment(output_file, ops)
 
 def main():
     parser = argparse.ArgumentParser(description="批量处理CSV文件并获取向量")
-    parser.add_argument("--csv", required=True, help="/home/user/opt/ssy/contract_template/data/contrac_csv/contract_new.csv.csv")
-    parser.add_argument("--output", default="/home/user/opt/ssy/contract_template/data/vector_data/vector_new.json", help="输出JSON文件路径")
+    parser.add_argument("--csv", required=True, nargs="+", help="输入CSV文件，可指定多个，\"-\" 表示从标准输入读取")
+    parser.add_argument("--output", default=config.VECTOR_FILE_PATH, help="输出JSON文件路径")
     parser.add_argument("--template-column", type=int, default=1, help="模板名称列索引（从0开始）")
     parser.add_argument("--template1-column", type=int, default=10, help="一级分类列索引（从0开始）")
     parser.add_argument("--template2-column", type=int, default=11, help="二级分类列索引（从0开始）")
@@ -169,11 +206,22 @@ def main():
     parser.add_argument("--text2-column", type=int, default=7, help="文本2列索引（从0开始）")
     parser.add_argument("--text3-column", type=int, default=8, help="文本3列索引（从0开始）")
     parser.add_argument("--text4-column", type=int, default=9, help="文本4列索引（从0开始）")
+    parser.add_argument("--keyword-columns", type=int, nargs=4, default=[2, 3, 4, 5],
+                        help="与文本1..文本4对应的关键词提取列索引（从0开始，以 | 分隔），用于构建关键词倒排索引")
+    parser.add_argument("--no-keywords", action="store_true", help="不读取关键词列")
     parser.add_argument("--batch-size", type=int, default=100, help="批处理大小")
-    parser.add_argument("--sleep", type=float, default=0.1, help="每次请求后的休眠时间（秒）")
+    parser.add_argument("--concurrency", type=int, default=8, help="同时发往向量服务的最大请求数")
+    parser.add_argument("--rate", type=float, default=20.0, help="每秒最多请求数，<=0 表示不限流")
+    parser.add_argument("--retries", type=int, default=3, help="请求失败后的重试次数")
     parser.add_argument("--append", action="store_true", help="是否追加到现有文件，而不是覆盖")
+    parser.add_argument("--incremental", action="store_true", help="增量模式：跳过内容未变化的行，只处理新增和变化的行（可用于中断后续跑）")
+    parser.add_argument("--no-compact", action="store_true", help="结束后不合并追加段，之后可用 compact_vector_store.py 合并")
+    parser.add_argument("--columnar-output", default=None, help="合并时同时生成的列式向量存储目录，默认在合并服务读取的数据文件时重建服务使用的列式存储")
+    parser.add_argument("--cache-path", default=None, help="向量缓存sqlite文件路径，重复运行时复用已获取的向量")
     args = parser.parse_args()
 
+    cache = EmbeddingCache(persist_path=args.cache_path) if args.cache_path else None
+
     first_save_append = False
     if args.append and os.path.exists(args.output):
         first_save_append = True
@@ -187,9 +235,16 @@ def main():
         text2_column=args.text2_column,
         text3_column=args.text3_column,
         text4_column=args.text4_column,
+        keyword_columns=None if args.no_keywords else args.keyword_columns,
         batch_size=args.batch_size,
-        sleep_time=args.sleep,
-        first_save_append=first_save_append  # 传递first_save_append参数
+        concurrency=args.concurrency,
+        rate=args.rate,
+        retries=args.retries,
+        first_save_append=first_save_append,  # 传递first_save_append参数
+        cache=cache,
+        incremental=args.incremental,
+        compact_output=not args.no_compact,
+        columnar_output=args.columnar_output
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import config
+from common.vector_index import VectorIndex, FIELDS, QUANTIZE_DTYPES, top_k_indices
+from common.vector_store import is_columnar_store, load_columnar
+
+# Python list 中每个float约占 8 字节指针 + 24 字节float对象
+PYTHON_FLOAT_BYTES = 32
+
+
+def load_index(path):
+    if is_columnar_store(path):
+        return VectorIndex.from_columnar(*load_columnar(path, mmap=False))
+    import json
+    with open(path, "r", encoding="utf-8") as f:
+        return VectorIndex.from_records(json.load(f))
+
+def sample_queries(vector_index, queries, seed=0):
+    """用库中随机模板的向量加噪声作为查询"""
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(vector_index), size=min(queries, len(vector_index)), replace=False)
+    result = {}
+    for field in FIELDS:
+        vectors = np.asarray(vector_index.matrices[field][rows], dtype=np.float32)
+        result[field] = vectors + rng.normal(0, 0.5 / np.sqrt(vector_index.dim), vectors.shape).astype(np.float32)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="比较不同向量精度下的打分误差、召回和内存占用")
+    parser.add_argument("--input", default=config.VECTOR_FILE_PATH, help="JSON文件或列式存储目录")
+    parser.add_argument("--queries", type=int, default=200, help="抽样查询数")
+    parser.add_argument("--k", type=int, default=3, help="比较前k个结果的重合率")
+    args = parser.parse_args()
+
+    base = load_index(args.input)
+    queries = sample_queries(base, args.queries)
+    base_scores = base.weighted_score(base.similarities(queries))
+    list_bytes = len(base) * len(FIELDS) * base.dim * PYTHON_FLOAT_BYTES
+
+    print(f"模板数 {len(base)}，维度 {base.dim}，Python列表约 {list_bytes / 1024 / 1024:.1f}MB")
+    print(f"{'精度':<8}{'内存(MB)':>10}{'压缩比':>8}{'最大误差':>10}{'平均误差':>10}{f'top{args.k}重合率':>12}{'耗时(ms)':>10}")
+    for dtype in QUANTIZE_DTYPES:
+        index = base.quantize(dtype)
+        start = time.perf_counter()
+        scores = index.weighted_score(index.similarities(queries))
+        elapsed = (time.perf_counter() - start) * 1000
+
+        errors = np.abs(scores - base_scores)
+        overlap = 0
+        for q in range(scores.shape[0]):
+            expected = set(top_k_indices(base_scores[q], args.k).tolist())
+            overlap += len(expected & set(top_k_indices(scores[q], args.k).tolist()))
+        overlap /= scores.shape[0] * min(args.k, len(base))
+
+        print(f"{dtype:<10}{index.nbytes / 1024 / 1024:>10.2f}{list_bytes / index.nbytes:>9.1f}x"
+              f"{errors.max():>10.4f}{errors.mean():>10.4f}{overlap:>14.3f}{elapsed:>10.2f}")
+
+if __name__ == "__main__":
+    main()
+    """
+    python /home/user/opt/ssy/contract_template/script/quantization_report.py --input /home/user/opt/ssy/contract_template/data/vector_data/vector_new.json
+    """
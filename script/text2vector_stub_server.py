@@ -0,0 +1,49 @@
+import os
+import sys
+import argparse
+import uvicorn
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import config
+from common.text2vector_stub import LATENCY_DISTRIBUTIONS, create_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线的 text2vector 服务替身：确定性散列向量，可注入延迟、错误和并发上限")
+    parser.add_argument("--host", default=config.TEXT2VECTOR_STUB_HOST, help="监听地址")
+    parser.add_argument("--port", type=int, default=config.TEXT2VECTOR_STUB_PORT, help="监听端口")
+    parser.add_argument("--dim", type=int, default=config.TEXT2VECTOR_STUB_DIM, help="向量维度，需与向量数据一致")
+    parser.add_argument("--latency", type=float, default=0.0, help="每次请求的延迟（秒），lognormal 时为中位数")
+    parser.add_argument("--latency-dist", default="fixed", choices=LATENCY_DISTRIBUTIONS, help="延迟分布")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="延迟离散程度：uniform 为半宽，normal 为标准差，lognormal 为对数标准差")
+    parser.add_argument("--latency-per-text", type=float, default=0.0, help="批量请求中每条文本额外增加的延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="请求返回错误的概率")
+    parser.add_argument("--error-status", type=int, default=503, help="注入错误时返回的状态码")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="同时处理的请求上限，超出的排队，0 为不限")
+    parser.add_argument("--queue-limit", type=int, default=0, help="排队请求上限，超出时返回429，0 为不限")
+    parser.add_argument("--no-batch", action="store_true", help="不提供批量接口（返回404），模拟只支持单条接口的服务")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子，相同种子下注入的延迟和错误可复现")
+    args = parser.parse_args()
+
+    app = create_app(
+        dim=args.dim,
+        latency=args.latency,
+        latency_dist=args.latency_dist,
+        latency_jitter=args.latency_jitter,
+        latency_per_text=args.latency_per_text,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        max_concurrency=args.max_concurrency,
+        queue_limit=args.queue_limit,
+        batch=not args.no_batch,
+        seed=args.seed
+    )
+    print(f"text2vector 替身监听 http://{args.host}:{args.port}/text2vector/ ，向量维度 {args.dim}；"
+          f"其他组件设置 EMBEDDING_STUB=1 即可使用")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
+    """
+    python /home/user/opt/ssy/contract_template/script/text2vector_stub_server.py --dim 768 --latency 0.05 --latency-dist lognormal --latency-jitter 0.5 --error-rate 0.01 --max-concurrency 16
+    """
@@ -1,57 +1,126 @@
 import os
-import json
-import docx
-from pathlib import Path
+import sys
+import argparse
+import posixpath
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from lxml import etree
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import config
+from common.fulltext_store import FulltextStore
+
+# 每批提取完成后写入一次旁路存储
+WRITE_BATCH_SIZE = 50
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+RELATIONSHIP = "{http://schemas.openxmlformats.org/package/2006/relationships}Relationship"
+
+def paragraph_text(paragraph):
+    """段落文本，与 python-docx 的 Paragraph.text 规则相同，也包括修订插入、内容控件中的文字"""
+    text = []
+    for run in paragraph.iter(W + "r"):
+        for node in run:
+            if node.tag == W + "t":
+                text.append(node.text or "")
+            elif node.tag in (W + "tab", W + "ptab"):
+                text.append("\t")
+            elif node.tag == W + "cr" or (node.tag == W + "br" and node.get(W + "type", "textWrapping") == "textWrapping"):
+                text.append("\n")
+            elif node.tag == W + "noBreakHyphen":
+                text.append("-")
+    return "".join(text)
+
+def main_document(package):
+    """docx包中正文部件的路径（通常为 word/document.xml）"""
+    for rel in etree.fromstring(package.read("_rels/.rels")).iter(RELATIONSHIP):
+        if rel.get("Type").endswith("/officeDocument"):
+            return posixpath.normpath(rel.get("Target").lstrip("/"))
+    return "word/document.xml"
 
 def extract_text_from_docx(file_path):
-    """从docx文件中提取文本内容"""
+    """
+    从docx文件中按文档顺序提取段落和表格的文本，表格每行一段、单元格以制表符分隔
+
+    直接解析正文XML，不加载样式、编号等其余部件，比 docx.Document 快数倍。
+    提取失败时返回 None（文件损坏、正在写入或被占用等），不写入存储，下次运行时重试。
+    """
     try:
-        doc = docx.Document(file_path)
+        with zipfile.ZipFile(file_path) as package:
+            body = etree.fromstring(package.read(main_document(package))).find(W + "body")
         full_text = []
-        for para in doc.paragraphs:
-            full_text.append(para.text)
+        for child in body:
+            if child.tag == W + "p":
+                full_text.append(paragraph_text(child))
+            elif child.tag == W + "tbl":
+                for row in child.iterchildren(W + "tr"):
+                    cells = [
+                        "\n".join(paragraph_text(paragraph) for paragraph in cell.iter(W + "p"))
+                        for cell in row.iterchildren(W + "tc")
+                    ]
+                    full_text.append("\t".join(cells))
         return '\n'.join(full_text)
     except Exception as e:
         print(f"处理文件 {file_path} 时出错: {e}")
-        return ""
+        return None
 
-def update_json_with_fulltext():
-    """更新vector_new.json文件，为每条数据添加fulltext字段"""
-    template_dir = "/home/user/opt/ssy/contract_template/data/合同模板(市场监管局）"
-    json_file_path = "/home/user/opt/ssy/contract_template/data/vector_data/vector_new.json"
-    
-    try:
-        with open(json_file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-    except Exception as e:
-        print(f"读取JSON文件时出错: {e}")
-        return
-    
-    for item in data:
-        # 默认设置fulltext为空字符串
-        item['fulltext'] = ""
-        
-        template_name = item.get('template', '')
-        if not template_name:
-            print(f"数据项缺少template字段，已设置fulltext为空字符串")
-            continue
-        
-        docx_path = os.path.join(template_dir, f"{template_name}.docx")
-        
-        if not os.path.exists(docx_path):
-            print(f"找不到文件: {docx_path}，已设置fulltext为空字符串")
-            continue
-        
-        fulltext = extract_text_from_docx(docx_path)
-        item['fulltext'] = fulltext
-        print(f"已更新模板 '{template_name}' 的fulltext字段")
-    
-    try:
-        with open(json_file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        print(f"已成功更新 {json_file_path}")
-    except Exception as e:
-        print(f"保存JSON文件时出错: {e}")
+def list_docx(template_dir):
+    """模板名 -> (路径, mtime_ns, size)，模板名为文件名去掉 .docx"""
+    files = {}
+    with os.scandir(template_dir) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith(".docx") and not entry.name.startswith("~$"):
+                stat = entry.stat()
+                files[entry.name[:-len(".docx")]] = (entry.path, stat.st_mtime_ns, stat.st_size)
+    return files
+
+def update_json_with_fulltext(template_dir=config.TEMPLATE_DOCX_DIR, fulltext_path=config.FULLTEXT_PATH,
+                              workers=None, force=False):
+    """
+    提取模板目录下全部docx的全文，写入旁路存储（不改写向量JSON）
+
+    每个文件按 (路径, mtime, size) 与上次提取时比较，没有变化的直接跳过；
+    需要提取的文件在进程池中并行处理，目录中已删除的文件同时从存储中删除。
+    提取失败的文件不写入存储（保留上次成功提取的全文），下次运行时重新提取。
+    """
+    store = FulltextStore(fulltext_path)
+    files = list_docx(template_dir)
+    sources = store.sources()
+
+    changed = [template for template, source in files.items() if force or sources.get(template) != source]
+    removed = [template for template in sources if template not in files]
+    print(f"共 {len(files)} 个模板文件，需要提取 {len(changed)} 个，未变化跳过 {len(files) - len(changed)} 个")
+
+    failed = []
+    if changed:
+        paths = [files[template][0] for template in changed]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            rows = []
+            for template, fulltext in zip(changed, executor.map(extract_text_from_docx, paths, chunksize=8)):
+                if fulltext is None:
+                    failed.append(template)
+                    continue
+                rows.append((template, fulltext) + files[template])
+                if len(rows) >= WRITE_BATCH_SIZE:
+                    store.put_many(rows)
+                    rows = []
+            store.put_many(rows)
+
+    if failed:
+        print(f"有 {len(failed)} 个模板文件提取失败，未写入全文存储，下次运行时重试: {', '.join(failed[:10])}")
+
+    if removed:
+        store.delete_many(removed)
+        print(f"有 {len(removed)} 个模板文件已删除，已从全文存储中移除")
+
+    print(f"已成功更新 {fulltext_path}，共 {len(store)} 个模板的全文")
+    store.close()
 
 if __name__ == "__main__":
-    update_json_with_fulltext()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="从docx模板并行提取全文，写入全文旁路存储")
+    parser.add_argument("--template-dir", default=config.TEMPLATE_DOCX_DIR, help="合同模板docx目录")
+    parser.add_argument("--fulltext-path", default=config.FULLTEXT_PATH, help="全文存储sqlite文件路径")
+    parser.add_argument("--workers", type=int, default=None, help="并行进程数，默认为CPU核数")
+    parser.add_argument("--force", action="store_true", help="忽略缓存，重新提取全部文件")
+    args = parser.parse_args()
+    update_json_with_fulltext(args.template_dir, args.fulltext_path, workers=args.workers, force=args.force)
@@ -1,76 +1,51 @@
-import json
-import csv
 import os
-
-csv_path = "/home/user/opt/ssy/contract_template/data/contrac_csv/contract_4_15_500.csv"
-json_path = "/home/user/opt/ssy/contract_template/data/vector_data/vector_new.json"
-
-csv_key_column_index = 1    
-csv_value_column_index = 13
-
-json_target_field = ["template2"]
-
-# 添加调试信息收集
-duplicate_keys = set()
-csv_updates = {}
-try:
-    with open(csv_path, newline='', encoding='utf-8') as f:
-        reader = csv.reader(f)
-        next(reader, None)
-        for row in reader:
-            if len(row) > max(csv_key_column_index, csv_value_column_index):
-                key = row[csv_key_column_index]
-                value = row[csv_value_column_index]
-                if key:
-                    # 检查是否有重复key
-                    if key in csv_updates:
-                        duplicate_keys.add(key)
-                    csv_updates[key] = value
-except Exception as e:
-    print(f"读取CSV文件时出错: {str(e)}")
-    exit(1)
-
-print(f"从CSV中读取了 {len(csv_updates)} 条更新数据")
-if duplicate_keys:
-    print(f"发现 {len(duplicate_keys)} 个重复的key，这些key的最后一个值会覆盖前面的值")
-
-# 收集未找到匹配的key
-not_found_keys = set(csv_updates.keys())
-try:
-    with open(json_path, "r", encoding="utf-8") as f:
-        json_data = json.load(f)
-except Exception as e:
-    print(f"读取JSON文件时出错: {str(e)}")
-    exit(1)
-
-update_count = 0
-
-if isinstance(json_data, list):
-    for item in json_data:
-        key = item.get("template")
-        if key in csv_updates:
-            if "parts" not in item:
-                item["parts"] = {}
-            item["template2"] = csv_updates[key]
-            update_count += 1
-            # 从未找到匹配的集合中移除已更新的key
-            if key in not_found_keys:
-                not_found_keys.remove(key)
-else:
-    print("不支持的JSON数据格式")
-    exit(1)
-
-# 输出未找到匹配的key的数量
-if not_found_keys:
-    print(f"有 {len(not_found_keys)} 个key在JSON数据中未找到匹配项")
-    # 如果数量不多，可以打印出来看看是哪些key
-    if len(not_found_keys) <= 10:
-        print(f"未匹配的key: {', '.join(not_found_keys)}")
-
-try:
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(json_data, f, ensure_ascii=False, indent=2)
-    print(f"成功更新了 {update_count} 条记录")
-except Exception as e:
-    print(f"保存JSON文件时出错: {str(e)}")
-    exit(1)
\ No newline at end of file
+import sys
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import config
+from common.template_store import PATCH_FIELDS, TemplateStore, read_csv_column
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按CSV批量修改向量数据中的字段（如 template2）")
+    parser.add_argument("--csv", required=True, help="/home/user/opt/ssy/contract_template/data/contrac_csv/contract_4_15_500.csv")
+    parser.add_argument("--store", default=config.VECTOR_FILE_PATH, help="向量JSON文件路径")
+    parser.add_argument("--key-column", type=int, default=1, help="模板名称列索引（从0开始）")
+    parser.add_argument("--value-column", type=int, default=13, help="新值所在列索引（从0开始）")
+    parser.add_argument("--field", default="template2", choices=[field for field in PATCH_FIELDS if field not in ("keywords", "vectors")], help="要修改的字段")
+    parser.add_argument("--compact", action="store_true", help="修改后立即合并进JSON文件，否则只写入追加段")
+    parser.add_argument("--columnar-output", default=None, help="合并时同时生成的列式向量存储目录，默认在合并服务读取的数据文件时重建服务使用的列式存储")
+    args = parser.parse_args()
+
+    try:
+        csv_updates, duplicate_keys = read_csv_column(args.csv, args.key_column, args.value_column)
+    except Exception as e:
+        print(f"读取CSV文件时出错: {str(e)}")
+        exit(1)
+
+    print(f"从CSV中读取了 {len(csv_updates)} 条更新数据")
+    if duplicate_keys:
+        print(f"发现 {len(duplicate_keys)} 个重复的key，这些key的最后一个值会覆盖前面的值")
+
+    store = TemplateStore(args.store)
+    not_found_keys = store.patch_many({key: {args.field: value} for key, value in csv_updates.items()})
+    update_count = store.pending
+
+    if not_found_keys:
+        print(f"有 {len(not_found_keys)} 个key在JSON数据中未找到匹配项")
+        if len(not_found_keys) <= 10:
+            print(f"未匹配的key: {', '.join(not_found_keys)}")
+
+    if args.compact:
+        store.compact(columnar_path=args.columnar_output)
+    else:
+        store.commit()
+    print(f"成功更新了 {update_count} 条记录，"
+          f"{len(csv_updates) - len(not_found_keys) - update_count} 条记录的值未变化")
+
+if __name__ == "__main__":
+    main()
+    """
+    python /home/user/opt/ssy/contract_template/script/update_data.py --csv /home/user/opt/ssy/contract_template/data/contrac_csv/contract_4_15_500.csv --field template2 --value-column 13
+    """
@@ -1,5 +1,4 @@
 from fastapi import FastAPI, HTTPException
-import requests
 import json
 import re
 import numpy as np
@@ -7,21 +6,11 @@ from typing import List, Dict, Any, Optional
 import uvicorn
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
+import os
+import sys
 
-
-def get_vector(text, api_url="http://192.168.10.58:8101/text2vector/"):
-    headers = {"Content-Type": "application/json"}
-    data = {"text": text}
-    try:
-        response = requests.post(api_url, headers=headers, json=data)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"请求失败，状态码: {response.status_code}")
-            return None
-    except Exception as e:
-        print(f"请求异常: {e}")
-        return None
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from common.embedding_client import embed_texts
 
 def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
     vec1 = np.array(vec1)
@@ -1063,7 +1052,6 @@ vec1 = [
         -0.01373291015625
       ]
 text = "本合同由委托单位与鉴定单位签订，可能涉及住建厅或监管局等监管机构。甲方为委托方，乙方为鉴定服务提供方，双方需明确各自的权利义务。"
-result = get_vector(text)
-vec2 = result["result"]
+vec2 = embed_texts([text])[0]
 output = cosine_similarity(vec1, vec2)
 print(output)
\ No newline at end of file